@@ -0,0 +1,294 @@
+"""Pipeline training model KAMA (status makanan & prediksi waktu busuk).
+
+Contoh:
+    python ai/main.py                      # training dengan pengaturan default
+    python ai/main.py --dataset export.parquet   # data dari GET /export di server
+    python ai/main.py --jobs 4 --promote   # pakai 4 core lalu salin ke ai/models/
+    python ai/main.py --temporal           # sertakan fitur temporal per device
+    python ai/main.py --temporal --with-lid   # + since_lid_open_s (butuh lid_status dari device)
+
+Dataset CSV di-parse sekali lalu disimpan sebagai Parquet (kolom sudah bertipe)
+di `ai/dataset/.cache/`; selama isi CSV tidak berubah, run berikutnya langsung
+membaca cache tersebut. Setiap run menulis artefak ke
+`ai/models/versions/<versi>/` beserta `report.json` berisi waktu training dan
+metrik. Format artefak ({'model': pipeline, 'metadata': {...}}) sama dengan
+yang dibaca `get_model()` / `get_spoil_model()` di server.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.metrics import accuracy_score, f1_score, mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import GridSearchCV, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+from xgboost import XGBClassifier, XGBRegressor
+
+AI_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_PATH = os.path.join(AI_DIR, 'dataset', 'dataset_kama.csv')
+CACHE_DIR = os.path.join(AI_DIR, 'dataset', '.cache')
+MODELS_DIR = os.path.join(AI_DIR, 'models')
+SERVER_DIR = os.path.abspath(os.path.join(AI_DIR, '..', 'server'))
+
+# Nama file yang dibaca server (MODEL_PATH / SPOIL_MODEL_PATH di server/app.py).
+STATUS_ARTIFACT = 'xgb_status_model.pkl'
+SPOIL_ARTIFACT = 'xgb_predicted_spoiled.pkl'
+
+BASE_FEATURES = ['temperature', 'humidity', 'gas_level', 'jenis_makanan']
+NUMERIC_FEATURES = ['temperature', 'humidity', 'gas_level']
+CATEGORICAL_FEATURES = ['jenis_makanan']
+# Urutan alfabetis, sama dengan label_map {0: bad, 1: good, 2: warning} di server.
+STATUS_LABELS = ['bad', 'good', 'warning']
+
+DTYPES = {
+    'id': 'int64',
+    'jenis_makanan': 'category',
+    'battery': 'float32',
+    'temperature': 'float32',
+    'humidity': 'float32',
+    'gas_level': 'float32',
+    'status': 'category',
+    'lid_status': 'category',
+    'expired_days': 'float32',
+    'predicted_spoiled': 'float32',
+}
+
+STATUS_PARAM_GRID = {
+    'clf__n_estimators': [100, 200],
+    'clf__max_depth': [3, 5, 7],
+    'clf__learning_rate': [0.05, 0.1],
+}
+SPOIL_PARAM_GRID = {
+    'reg__n_estimators': [100, 200, 400],
+    'reg__max_depth': [3, 5],
+    'reg__learning_rate': [0.05, 0.1],
+}
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def load_dataset(path=DATASET_PATH, use_cache=True):
+    """Membaca dataset bertipe; memakai cache Parquet jika isi CSV tidak berubah.
+
+    File `.parquet` (mis. hasil `GET /export?format=parquet`) dibaca langsung.
+    """
+    digest = _file_digest(path)
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+        df = df.astype({k: v for k, v in DTYPES.items() if k in df.columns})
+        df = df.dropna(subset=NUMERIC_FEATURES + ['status']).sort_values('recorded_at').reset_index(drop=True)
+        return df, digest, False
+    base = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(CACHE_DIR, f'{base}.{digest}.parquet')
+    if use_cache and os.path.exists(cache_path):
+        return pd.read_parquet(cache_path), digest, True
+
+    df = pd.read_csv(path, dtype=DTYPES)
+    df['recorded_at'] = pd.to_datetime(df['recorded_at'], format='%Y-%m-%d %H:%M:%S.%f %z', errors='coerce', utc=True)
+    df = df.dropna(subset=NUMERIC_FEATURES + ['status']).sort_values('recorded_at').reset_index(drop=True)
+
+    if use_cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        try:
+            df.to_parquet(cache_path, index=False)
+        except ImportError as e:
+            print(f"Cache Parquet dilewati (pyarrow/fastparquet tidak tersedia): {e}")
+    return df, digest, False
+
+
+def add_temporal_features(df, with_lid=False):
+    """Me-replay dataset ke feature engine server untuk menghasilkan fitur temporal.
+
+    Dataset tidak memiliki device_id, sehingga seluruh baris dianggap satu device
+    yang diurutkan berdasarkan waktu (atau per device_id jika kolomnya ada).
+
+    `since_lid_open_s` hanya disertakan dengan `with_lid=True`: firmware saat ini
+    tidak mengirim `lid_status` ke /ingest, sehingga saat serving fitur itu
+    selalu NaN meskipun dataset CSV memiliki kolomnya.
+    """
+    if SERVER_DIR not in sys.path:
+        sys.path.insert(0, SERVER_DIR)
+    import features as feature_engine
+
+    if with_lid and 'lid_status' not in df.columns:
+        raise ValueError("--with-lid membutuhkan kolom lid_status di dataset")
+    df = df.copy()
+    device_ids = df['device_id'] if 'device_id' in df.columns else pd.Series('default', index=df.index)
+    lids = df['lid_status'] if with_lid else [None] * len(df)
+    names = [f for f in feature_engine.TEMPORAL_FEATURES if with_lid or f != 'since_lid_open_s']
+    states = {}
+    rows = []
+    for device_id, ts, temp, gas, lid in zip(device_ids, df['recorded_at'], df['temperature'], df['gas_level'], lids):
+        state = states.setdefault(device_id, feature_engine.new_state())
+        rows.append(feature_engine.update_state(state, ts.timestamp(), float(temp), float(gas), lid))
+    temporal = pd.DataFrame(rows, index=df.index)[names]
+    return pd.concat([df, temporal.astype('float32')], axis=1), names
+
+
+def _preprocessor(numeric_features):
+    return ColumnTransformer([
+        ('cat', OneHotEncoder(handle_unknown='ignore'), CATEGORICAL_FEATURES),
+        ('num', 'passthrough', numeric_features),
+    ])
+
+
+def _search(pipeline, param_grid, X, y, scoring, jobs):
+    search = GridSearchCV(pipeline, param_grid, scoring=scoring, cv=5, n_jobs=jobs, refit=True)
+    started = time.perf_counter()
+    search.fit(X, y)
+    return search, time.perf_counter() - started
+
+
+def train_status_model(df, jobs, seed):
+    # Firmware mengirim status 'unknown' saat /predict gagal; baris seperti itu
+    # (mis. dari GET /export) tidak punya label yang bisa dipelajari.
+    labeled = df['status'].astype(str).isin(STATUS_LABELS)
+    dropped = int((~labeled).sum())
+    df = df[labeled]
+    X = df[BASE_FEATURES]
+    y = df['status'].astype(str).map({label: i for i, label in enumerate(STATUS_LABELS)})
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed, stratify=y)
+    pipeline = Pipeline([
+        ('prep', _preprocessor(NUMERIC_FEATURES)),
+        # n_jobs=1 per model: paralelisme ada di level grid search.
+        ('clf', XGBClassifier(objective='multi:softprob', random_state=seed, n_jobs=1, eval_metric='mlogloss')),
+    ])
+    search, seconds = _search(pipeline, STATUS_PARAM_GRID, X_train, y_train, 'f1_macro', jobs)
+    y_pred = search.best_estimator_.predict(X_test)
+    metrics = {
+        'accuracy': float(accuracy_score(y_test, y_pred)),
+        'f1_macro': float(f1_score(y_test, y_pred, average='macro')),
+        'cv_f1_macro': float(search.best_score_),
+    }
+    return search.best_estimator_, {'features': BASE_FEATURES, 'best_params': search.best_params_,
+                                    'train_seconds': round(seconds, 2), 'dropped_rows': dropped,
+                                    'metrics': metrics}
+
+
+def train_spoil_model(df, jobs, seed, temporal_features=()):
+    numeric = NUMERIC_FEATURES + list(temporal_features)
+    features = BASE_FEATURES + list(temporal_features)
+    # Data export dari server bisa berisi baris yang belum diprediksi.
+    df = df.dropna(subset=['predicted_spoiled'])
+    X = df[features]
+    y = df['predicted_spoiled']
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed)
+    pipeline = Pipeline([
+        ('prep', _preprocessor(numeric)),
+        ('reg', XGBRegressor(objective='reg:squarederror', random_state=seed, n_jobs=1)),
+    ])
+    search, seconds = _search(pipeline, SPOIL_PARAM_GRID, X_train, y_train, 'neg_mean_absolute_error', jobs)
+    y_pred = search.best_estimator_.predict(X_test)
+    metrics = {
+        'mae': float(mean_absolute_error(y_test, y_pred)),
+        'rmse': float(np.sqrt(mean_squared_error(y_test, y_pred))),
+        'r2': float(r2_score(y_test, y_pred)),
+        'cv_mae': float(-search.best_score_),
+    }
+    return search.best_estimator_, {'features': features, 'best_params': search.best_params_,
+                                    'train_seconds': round(seconds, 2), 'metrics': metrics}
+
+
+def _library_versions():
+    import sklearn
+    import xgboost
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'scikit-learn': sklearn.__version__,
+        'xgboost': xgboost.__version__,
+    }
+
+
+def promote_artifact(src, dst):
+    """Menyalin artefak lewat file sementara di folder tujuan lalu `os.replace`.
+
+    Server yang sedang memuat ulang model (lihat `get_model()` /
+    `get_spoil_model()`) tidak pernah membaca file yang baru setengah tertulis.
+    """
+    tmp = f'{dst}.{os.getpid()}.tmp'
+    try:
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Training model status & prediksi busuk KAMA.')
+    parser.add_argument('--dataset', default=DATASET_PATH, help='path CSV dataset')
+    parser.add_argument('--jobs', type=int, default=-1, help='jumlah core untuk grid search (-1 = semua)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--temporal', action='store_true', help='latih model spoil dengan fitur temporal per device')
+    parser.add_argument('--with-lid', action='store_true',
+                        help='sertakan since_lid_open_s (hanya jika device mengirim lid_status ke /ingest)')
+    parser.add_argument('--no-cache', action='store_true', help='abaikan cache Parquet dataset')
+    parser.add_argument('--promote', action='store_true', help='salin artefak ke ai/models/ agar dipakai server')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    df, digest, cached = load_dataset(args.dataset, use_cache=not args.no_cache)
+    load_seconds = time.perf_counter() - started
+    print(f"Dataset: {len(df)} baris ({'cache' if cached else 'CSV'}, {load_seconds:.2f}s)")
+
+    temporal_features = []
+    if args.temporal:
+        df, temporal_features = add_temporal_features(df, with_lid=args.with_lid)
+
+    status_model, status_report = train_status_model(df, args.jobs, args.seed)
+    if status_report['dropped_rows']:
+        print(f"Status model: {status_report['dropped_rows']} baris dengan status di luar {STATUS_LABELS} dilewati")
+    print(f"Status model: {status_report['metrics']} ({status_report['train_seconds']}s)")
+    spoil_model, spoil_report = train_spoil_model(df, args.jobs, args.seed, temporal_features)
+    print(f"Spoil model: {spoil_report['metrics']} ({spoil_report['train_seconds']}s)")
+
+    version = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{digest}"
+    out_dir = os.path.join(MODELS_DIR, 'versions', version)
+    os.makedirs(out_dir, exist_ok=True)
+    report = {
+        'version': version,
+        'dataset': {'path': os.path.relpath(args.dataset, AI_DIR), 'sha256_12': digest, 'rows': len(df),
+                    'from_cache': cached, 'load_seconds': round(load_seconds, 2)},
+        'seed': args.seed,
+        'jobs': args.jobs,
+        'libraries': _library_versions(),
+        'status_model': status_report,
+        'spoil_model': spoil_report,
+        'total_seconds': round(time.perf_counter() - started, 2),
+    }
+    for artifact, model, model_report in (
+        (STATUS_ARTIFACT, status_model, status_report),
+        (SPOIL_ARTIFACT, spoil_model, spoil_report),
+    ):
+        joblib.dump({'model': model, 'metadata': {'version': version, **model_report}}, os.path.join(out_dir, artifact))
+    with open(os.path.join(out_dir, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Artefak ditulis ke {out_dir}")
+
+    if args.promote:
+        for artifact in (STATUS_ARTIFACT, SPOIL_ARTIFACT):
+            promote_artifact(os.path.join(out_dir, artifact), os.path.join(MODELS_DIR, artifact))
+        print(f"Versi {version} dipromosikan ke {MODELS_DIR}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Helper chatbot Gemini bersama untuk halaman dashboard.
+
+- Klien `genai` dikonfigurasi sekali per proses dan model di-cache per persona.
+- Tiap sesi browser memakai satu `ChatSession` sehingga konteks percakapan
+  dipakai ulang; riwayat dipangkas ke `MAX_HISTORY_TURNS` giliran terakhir.
+- Jawaban di-cache selama `RESPONSE_CACHE_TTL_S` berdasarkan pertanyaan yang
+  dinormalisasi, konteks box yang dikasarkan (status + pita nilai, lihat
+  `box_context_key`), dan hash riwayat percakapan yang sudah dipangkas, sehingga
+  pertanyaan lanjutan ("kenapa?") tidak memakai jawaban dari percakapan lain.
+- Bacaan box terbaru disisipkan hanya pada pesan yang sedang dikirim, tidak
+  disimpan di riwayat, agar token tidak membengkak.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import google.generativeai as genai
+import streamlit as st
+
+MODEL_NAME = "gemini-1.5-flash"
+MAX_HISTORY_TURNS = 6
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_CACHE_TTL_S = 600
+# Lebar pita nilai sensor untuk kunci cache.
+CONTEXT_BANDS = {"temperature": 2.0, "humidity": 10.0, "gas_level": 100.0}
+
+
+@st.cache_resource
+def _configure(api_key):
+    genai.configure(api_key=api_key)
+    return True
+
+
+@st.cache_resource
+def get_model(api_key, system_instruction):
+    """GenerativeModel bersama untuk satu persona (system instruction)."""
+    _configure(api_key)
+    return genai.GenerativeModel(MODEL_NAME, system_instruction=system_instruction)
+
+
+@st.cache_resource
+def _response_cache():
+    return {"lock": threading.Lock(), "items": OrderedDict()}
+
+
+def normalize_question(text):
+    """Huruf kecil, tanpa tanda baca, spasi dirapikan."""
+    text = re.sub(r"[^\w\s]", " ", (text or "").lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def box_context(row):
+    """Ringkasan bacaan box terbaru (pd.Series/dict) untuk disisipkan ke prompt."""
+    if row is None:
+        return ""
+    try:
+        return (
+            "Bacaan KAMA Box terbaru: "
+            f"suhu {float(row.get('temperature')):.1f} °C, "
+            f"kelembapan {float(row.get('humidity')):.1f} %, "
+            f"gas {float(row.get('gas_level')):.0f} ppm, "
+            f"status {row.get('status')}."
+        )
+    except (TypeError, ValueError):
+        return ""
+
+
+def box_context_key(row):
+    """Versi kasar `box_context` untuk kunci cache: status dan pita tiap nilai."""
+    if row is None:
+        return ""
+    parts = [str(row.get("status"))]
+    for field, width in CONTEXT_BANDS.items():
+        try:
+            parts.append(str(math.floor(float(row.get(field)) / width)))
+        except (TypeError, ValueError):
+            parts.append("-")
+    return ":".join(parts)
+
+
+def _history_digest(history):
+    """Hash isi riwayat chat (dict yang kita set maupun Content dari SDK)."""
+    h = hashlib.sha256()
+    for turn in history:
+        if isinstance(turn, dict):
+            role, parts = turn["role"], turn["parts"]
+        else:
+            role, parts = turn.role, [p.text for p in turn.parts]
+        h.update(role.encode("utf-8") + b"\x1e")
+        for part in parts:
+            h.update(normalize_question(part).encode("utf-8") + b"\x1f")
+    return h.hexdigest()
+
+
+def _cache_key(persona, context_key, history, question):
+    raw = "\x1f".join([persona, context_key, _history_digest(history), normalize_question(question)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key):
+    cache = _response_cache()
+    with cache["lock"]:
+        entry = cache["items"].get(key)
+        if entry is None:
+            return None
+        stored_at, reply = entry
+        if time.monotonic() - stored_at > RESPONSE_CACHE_TTL_S:
+            del cache["items"][key]
+            return None
+        cache["items"].move_to_end(key)
+        return reply
+
+
+def _cache_put(key, reply):
+    cache = _response_cache()
+    with cache["lock"]:
+        cache["items"][key] = (time.monotonic(), reply)
+        cache["items"].move_to_end(key)
+        while len(cache["items"]) > RESPONSE_CACHE_SIZE:
+            cache["items"].popitem(last=False)
+
+
+def _append_turn(history, question, reply):
+    """Menambah satu giliran (tanpa konteks box) lalu memangkas ke MAX_HISTORY_TURNS."""
+    history = list(history) + [
+        {"role": "user", "parts": [question]},
+        {"role": "model", "parts": [reply]},
+    ]
+    return history[-2 * MAX_HISTORY_TURNS:]
+
+
+def stream_reply(api_key, persona, system_instruction, question, context="", context_key="", placeholder=None):
+    """Mengirim `question` lewat ChatSession milik sesi ini dan mengembalikan jawabannya.
+
+    `context` disisipkan ke prompt, `context_key` (dari `box_context_key`) dipakai
+    untuk kunci cache. Jika `placeholder` diberikan, jawaban di-stream ke sana.
+    """
+    state_key = f"_chat_session_{persona}"
+    model = get_model(api_key, system_instruction)
+    chat = st.session_state.get(state_key)
+    if chat is None:
+        chat = model.start_chat(history=[])
+        st.session_state[state_key] = chat
+
+    key = _cache_key(persona, context_key, chat.history, question)
+    reply = _cache_get(key)
+    if reply is None:
+        message = f"{context}\n\nPertanyaan: {question}" if context else question
+        reply = ""
+        for chunk in chat.send_message(message, stream=True):
+            reply += chunk.text or ""
+            if placeholder is not None:
+                placeholder.markdown(reply + "▌")
+        _cache_put(key, reply)
+        # Ganti giliran yang baru dikirim (berisi konteks box) dengan pertanyaan aslinya.
+        chat.history = _append_turn(chat.history[:-2], question, reply)
+    else:
+        chat.history = _append_turn(chat.history, question, reply)
+    if placeholder is not None:
+        placeholder.markdown(reply)
+    return reply
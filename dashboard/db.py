@@ -0,0 +1,207 @@
+"""Akses database bersama untuk semua halaman dashboard.
+
+Satu pool kecil per database (lihat `_DBPool`) dibagi oleh semua sesi browser
+dan semua halaman; `latest_reading()` menyediakan bacaan box terbaru yang
+di-cache singkat agar halaman mana pun bisa menyisipkannya ke prompt chatbot.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+from dotenv import load_dotenv
+
+try:
+    import psycopg2
+    from psycopg2.extensions import QueryCanceledError
+    from psycopg2.pool import ThreadedConnectionPool
+except ModuleNotFoundError:
+    import psycopg as psycopg2
+    from psycopg.errors import QueryCanceled as QueryCanceledError
+    ThreadedConnectionPool = None
+
+# --- Secrets helper ---
+def get_secret_value(key, default=None):
+    try:
+        val = st.secrets[key]
+        if val is not None:
+            return val
+    except Exception:
+        pass
+    return os.getenv(key, default)
+
+# --- DB connections ---
+# Satu pool kecil per database dibagi oleh semua sesi browser. Tiap query
+# meminjam koneksi sendiri (bukan satu socket bersama), koneksi yang rusak
+# dibuang dari pool, dan setiap statement dibatasi statement_timeout.
+# Koneksi yang menganggur lebih dari DB_POOL_CHECK_IDLE_S dicek dengan SELECT 1
+# sebelum dipinjamkan, sehingga socket mati setelah restart database dibuang
+# alih-alih membuat refresh berikutnya gagal.
+DB_POOL_CHECK_IDLE_S = 30
+DB_CHECKOUT_TIMEOUT_S = 10
+
+class PoolTimeout(Exception):
+    pass
+
+class _DBPool:
+    def __init__(self, conn_kwargs, maxconn):
+        self.conn_kwargs = conn_kwargs
+        self.maxconn = maxconn
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.pool = ThreadedConnectionPool(1, maxconn, **conn_kwargs) if ThreadedConnectionPool else None
+        self.last_used = {}
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self.last_used.get(id(conn), 0) < DB_POOL_CHECK_IDLE_S:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def getconn(self):
+        if not self.pool:
+            conn = psycopg2.connect(**self.conn_kwargs)
+            conn.autocommit = True
+            return conn
+        # Paling banyak maxconn koneksi basi yang perlu dibuang.
+        for _ in range(self.maxconn):
+            conn = self.pool.getconn()
+            conn.autocommit = True
+            if self._healthy(conn):
+                return conn
+            self.last_used.pop(id(conn), None)
+            self.pool.putconn(conn, close=True)
+        return self.pool.getconn()
+
+    def putconn(self, conn, close=False):
+        if self.pool:
+            close = close or bool(conn.closed)
+            if close:
+                self.last_used.pop(id(conn), None)
+            else:
+                self.last_used[id(conn)] = time.monotonic()
+            self.pool.putconn(conn, close=close)
+        else:
+            conn.close()
+
+def _db_conn_kwargs(primary, fallback):
+    def _val(name, default=None):
+        return get_secret_value(f"{primary}_DB_{name}") or get_secret_value(f"{fallback}_DB_{name}") or default
+    timeout_ms = int(get_secret_value("DB_STATEMENT_TIMEOUT_MS", 5000))
+    return {
+        "host": _val("HOST"),
+        "port": int(_val("PORT", 5432)),
+        "dbname": _val("NAME"),
+        "user": _val("USER"),
+        "password": _val("PASS"),
+        "sslmode": get_secret_value(f"{primary}_DB_SSLMODE", "require"),
+        "connect_timeout": 10,
+        "options": f"-c statement_timeout={timeout_ms}",
+    }
+
+# Exception tidak di-cache oleh st.cache_resource, jadi kegagalan koneksi
+# akan dicoba lagi pada refresh berikutnya.
+@st.cache_resource
+def _realtime_pool():
+    load_dotenv(os.path.join(os.path.dirname(__file__), '../server/.env'))
+    return _DBPool(_db_conn_kwargs("REALTIME", "SERVER"), int(get_secret_value("DB_POOL_MAX", 5)))
+
+@st.cache_resource
+def _server_pool():
+    load_dotenv(os.path.join(os.path.dirname(__file__), '../server/.env'))
+    return _DBPool(_db_conn_kwargs("SERVER", "REALTIME"), int(get_secret_value("DB_POOL_MAX", 5)))
+
+def get_realtime_pool():
+    try:
+        return _realtime_pool()
+    except Exception as e:
+        st.error(f"❌ Gagal connect realtime_db: {e}")
+        return None
+
+def get_server_pool():
+    try:
+        return _server_pool()
+    except Exception as e:
+        st.error(f"❌ Gagal connect server_db: {e}")
+        return None
+
+@contextmanager
+def _checkout(db):
+    if not db.slots.acquire(timeout=DB_CHECKOUT_TIMEOUT_S):
+        raise PoolTimeout(f"semua koneksi database sedang dipakai (menunggu {DB_CHECKOUT_TIMEOUT_S} detik)")
+    conn = None
+    broken = False
+    try:
+        conn = db.getconn()
+        yield conn
+    except QueryCanceledError:
+        # statement_timeout: koneksinya masih sehat, cukup diteruskan.
+        raise
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        if conn is not None:
+            db.putconn(conn, close=broken)
+        db.slots.release()
+
+def run_query(db, fn, retries=1):
+    """Menjalankan fn(conn) dengan koneksi pinjaman; diulang sekali jika koneksi putus.
+
+    Query yang dibatalkan statement_timeout tidak diulang.
+    """
+    for attempt in range(retries + 1):
+        try:
+            with _checkout(db) as conn:
+                return fn(conn)
+        except QueryCanceledError:
+            raise
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            if attempt >= retries:
+                raise
+
+# --- Query helpers ---
+def fetch_latest_data(db, limit=1):
+    if db is None:
+        return pd.DataFrame()
+    try:
+        q = "SELECT * FROM kama_realtime ORDER BY recorded_at DESC LIMIT %s;"
+        return run_query(db, lambda conn: pd.read_sql(q, conn, params=(int(limit),)))
+    except Exception as e:
+        st.error(f"Gagal ambil data realtime: {e}")
+        return pd.DataFrame()
+
+def fetch_history(db, rows=100):
+    if db is None:
+        return pd.DataFrame()
+    try:
+        q = "SELECT * FROM kama_realtime ORDER BY recorded_at DESC LIMIT %s;"
+        return run_query(db, lambda conn: pd.read_sql(q, conn, params=(int(rows),)))
+    except Exception as e:
+        st.error(f"Gagal ambil history: {e}")
+        return pd.DataFrame()
+
+# Bacaan terbaru untuk konteks chatbot: di-cache singkat agar tiap rerun halaman
+# tidak menambah query, tetapi tetap segar walau halaman utama tidak dibuka.
+LATEST_READING_TTL_S = 10
+
+@st.cache_data(ttl=LATEST_READING_TTL_S, show_spinner=False)
+def _latest_reading():
+    q = "SELECT * FROM kama_realtime ORDER BY recorded_at DESC LIMIT 1;"
+    df = run_query(_realtime_pool(), lambda conn: pd.read_sql(q, conn))
+    return None if df.empty else df.iloc[0].to_dict()
+
+def latest_reading():
+    """Bacaan kama_realtime terbaru sebagai dict, atau None jika tidak tersedia."""
+    try:
+        return _latest_reading()
+    except Exception as e:
+        st.warning(f"Gagal ambil bacaan terbaru: {e}")
+        return None
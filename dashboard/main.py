@@ -3,17 +3,20 @@ import pandas as pd
 import os
 import time
 import plotly.express as px
-from dotenv import load_dotenv
-try:
-    import psycopg2
-except ModuleNotFoundError:
-    import psycopg as psycopg2
 import joblib
 import gdown
 from pathlib import Path
 import numpy as np
-import google.generativeai as genai
 import traceback
+import chatbot
+from db import (
+    fetch_history,
+    fetch_latest_data,
+    get_realtime_pool,
+    get_secret_value,
+    get_server_pool,
+    run_query,
+)
 
 # --- Konfigurasi Halaman ---
 st.set_page_config(
@@ -23,70 +26,6 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-# --- Secrets helper ---
-def _get_secret_value(key, default=None):
-    try:
-        val = st.secrets[key]
-        if val is not None:
-            return val
-    except Exception:
-        pass
-    return os.getenv(key, default)
-
-# --- DB connections ---
-@st.cache_resource
-def get_realtime_conn():
-    load_dotenv(os.path.join(os.path.dirname(__file__), '../server/.env'))
-    try:
-        return psycopg2.connect(
-            host=_get_secret_value("REALTIME_DB_HOST") or _get_secret_value("SERVER_DB_HOST"),
-            port=int(_get_secret_value("REALTIME_DB_PORT") or _get_secret_value("SERVER_DB_PORT")),
-            dbname=_get_secret_value("REALTIME_DB_NAME") or _get_secret_value("SERVER_DB_NAME"),
-            user=_get_secret_value("REALTIME_DB_USER") or _get_secret_value("SERVER_DB_USER"),
-            password=_get_secret_value("REALTIME_DB_PASS") or _get_secret_value("SERVER_DB_PASS"),
-            sslmode=_get_secret_value("REALTIME_DB_SSLMODE", "require"),
-        )
-    except Exception as e:
-        st.error(f"❌ Gagal connect realtime_db: {e}")
-        return None
-
-@st.cache_resource
-def get_server_conn():
-    load_dotenv(os.path.join(os.path.dirname(__file__), '../server/.env'))
-    try:
-        return psycopg2.connect(
-            host=_get_secret_value("SERVER_DB_HOST") or _get_secret_value("REALTIME_DB_HOST"),
-            port=int(_get_secret_value("SERVER_DB_PORT") or _get_secret_value("REALTIME_DB_PORT")),
-            dbname=_get_secret_value("SERVER_DB_NAME") or _get_secret_value("REALTIME_DB_NAME"),
-            user=_get_secret_value("SERVER_DB_USER") or _get_secret_value("REALTIME_DB_USER"),
-            password=_get_secret_value("SERVER_DB_PASS") or _get_secret_value("REALTIME_DB_PASS"),
-            sslmode=_get_secret_value("SERVER_DB_SSLMODE", "require"),
-        )
-    except Exception as e:
-        st.error(f"❌ Gagal connect server_db: {e}")
-        return None
-
-# --- Query helpers ---
-def fetch_latest_data(conn, limit=1):
-    if conn is None:
-        return pd.DataFrame()
-    try:
-        q = f"SELECT * FROM kama_realtime ORDER BY recorded_at DESC LIMIT {limit};"
-        return pd.read_sql(q, conn)
-    except Exception as e:
-        st.error(f"Gagal ambil data realtime: {e}")
-        return pd.DataFrame()
-
-def fetch_history(conn, rows=100):
-    if conn is None:
-        return pd.DataFrame()
-    try:
-        q = f"SELECT * FROM kama_realtime ORDER BY recorded_at DESC LIMIT {rows};"
-        return pd.read_sql(q, conn)
-    except Exception as e:
-        st.error(f"Gagal ambil history: {e}")
-        return pd.DataFrame()
-
 # --- Models from Google Drive ---
 STATUS_MODEL_URL = "https://drive.google.com/file/d/1XKjJVLBKBLZtTCGxeSsCpLkk9e-IT-IA/view?usp=sharing"
 SPOIL_MODEL_URL = "https://drive.google.com/file/d/1VoDO2brU5gFXJOZnYOFdaCl0Y_0RWLUy/view?usp=sharing"
@@ -160,57 +99,53 @@ def predict_with_models(row: pd.Series):
     return label, spoil_days
 
 
-def fetch_recommendation_from_server(conn, realtime_id):
+def _fetchone(db, query, params=None):
+    def _run(conn):
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchone()
+    return run_query(db, _run)
+
+def fetch_recommendation_from_server(db, realtime_id):
     """Fetch recommendation_text from kama_server by id. Returns string or None."""
-    if conn is None:
+    if db is None:
         return None
     try:
-        if isinstance(realtime_id, (int, np.int64)):
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT recommendation_text FROM kama_server WHERE id = %s ORDER BY recorded_at DESC LIMIT 1",
-                    (realtime_id,)
-                )
-                row = cur.fetchone()
-                if row and row[0]:
-                    return row[0]
-        else:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "SELECT recommendation_text FROM kama_server WHERE id = %s ORDER BY recorded_at DESC LIMIT 1",
-                    (str(realtime_id),)
-                )
-                row = cur.fetchone()
-                if row and row[0]:
-                    return row[0]
+        if not isinstance(realtime_id, (int, np.int64)):
+            realtime_id = str(realtime_id)
+        row = _fetchone(
+            db,
+            "SELECT recommendation_text FROM kama_server WHERE id = %s ORDER BY recorded_at DESC LIMIT 1",
+            (realtime_id,)
+        )
+        if row and row[0]:
+            return row[0]
     except Exception as e:
         st.warning(f"Gagal ambil rekomendasi dari server DB: {e}")
     return None
 
-def fetch_latest_prediction_and_reco(conn):
+def fetch_latest_prediction_and_reco(db):
     """Fetch the latest prediction and recommendation from kama_server."""
-    if conn is None:
-        return None, None, None
+    if db is None:
+        return None, None, None, None
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT predicted_spoil, recommendation_text, recorded_at, status FROM kama_server ORDER BY recorded_at DESC LIMIT 1"
-            )
-            row = cur.fetchone()
-            if row:
-                return row[0], row[1], row[2], row[3]
+        row = _fetchone(
+            db,
+            "SELECT predicted_spoil, recommendation_text, recorded_at, status FROM kama_server ORDER BY recorded_at DESC LIMIT 1"
+        )
+        if row:
+            return row[0], row[1], row[2], row[3]
     except Exception as e:
         st.warning(f"Gagal ambil prediksi & rekomendasi dari server DB: {e}")
-        return None, None, None, None
+    return None, None, None, None
 
 
 # --- UI ---
 st.title("📦 KAMA Smartbox")
 st.markdown("Monitoring realtime makanan oleh KAMA Smartbox")
 
-# Use single connection function since both realtime and server point to the same DB
-realtime_conn = get_realtime_conn()
-server_conn = get_server_conn()
+realtime_db = get_realtime_pool()
+server_db = get_server_pool()
 
 # Auto-refresh 10 detik
 try:
@@ -220,7 +155,11 @@ try:
 except Exception:
     pass
 
-latest = fetch_latest_data(realtime_conn, 1)
+latest = fetch_latest_data(realtime_db, 1)
+# Bacaan terbaru diambil sekali per refresh lalu dipakai juga oleh chatbot.
+latest_row = None if latest.empty else latest.iloc[0]
+box_context = chatbot.box_context(latest_row)
+box_context_key = chatbot.box_context_key(latest_row)
 if latest.empty:
     st.warning("Tidak ada data realtime di `kama_realtime`.")
 else:
@@ -246,12 +185,12 @@ else:
 
     # Detail + grafik
     with st.expander("Lihat detail historis & prediksi"):
-        hist = fetch_history(realtime_conn, 500)
+        hist = fetch_history(realtime_db, 500)
         if not hist.empty:
             hist['recorded_at'] = pd.to_datetime(hist['recorded_at'])
             
             # Ambil prediksi & rekomendasi terbaru dari server
-            pred_spoil, rec_text, pred_timestamp, pred_status = fetch_latest_prediction_and_reco(server_conn)
+            pred_spoil, rec_text, pred_timestamp, pred_status = fetch_latest_prediction_and_reco(server_db)
 
             # Tampilkan metrik prediksi
             if pred_spoil is not None and pred_timestamp is not None:
@@ -272,10 +211,12 @@ else:
             else:
                 st.info("Rekomendasi belum tersedia di server. Tunggu proses prediksi dari server.")
 
+            # Grafik bertangga (sample-and-hold): dengan deadband di server, baris
+            # berikutnya baru ditulis saat nilai bergeser, jadi nilai ditahan sampai titik berikutnya.
             # Grafik suhu & kelembapan
             try:
                 fig1 = px.line(hist.sort_values('recorded_at'), x='recorded_at',
-                               y=['temperature', 'humidity'],
+                               y=['temperature', 'humidity'], line_shape='hv',
                                title="Grafik Suhu & Kelembapan")
                 st.plotly_chart(fig1, use_container_width=True)
             except Exception as e:
@@ -284,7 +225,7 @@ else:
             # Grafik gas
             try:
                 fig2 = px.area(hist.sort_values('recorded_at'), x='recorded_at',
-                               y='gas_level', title="Grafik Gas (MQ-135)")
+                               y='gas_level', line_shape='hv', title="Grafik Gas (MQ-135)")
                 st.plotly_chart(fig2, use_container_width=True)
             except Exception as e:
                 st.warning(f"Gagal grafik gas: {e}")
@@ -294,6 +235,8 @@ else:
             st.info("Tidak ada data historis.")
 
 # --- Chatbot ---
+CHATBOT_INSTRUCTION = "Anda adalah AI KAMA Smartbox. Jawab singkat dalam Bahasa Indonesia."
+
 st.markdown("---")
 st.subheader("🤖 Chatbot KAMA")
 
@@ -313,18 +256,13 @@ if prompt:
     with st.chat_message("assistant"):
         msg = st.empty()
         reply = ""
-        key = _get_secret_value("GEMINI_API_KEY")
+        key = get_secret_value("GEMINI_API_KEY")
         if key:
             try:
-                genai.configure(api_key=key)
-                model = genai.GenerativeModel("gemini-1.5-flash")
-                for r in model.generate_content(
-                    f"Anda adalah AI KAMA Smartbox. Jawab singkat dalam Bahasa Indonesia.\nPertanyaan: {prompt}",
-                    stream=True
-                ):
-                    reply += r.text or ""
-                    msg.markdown(reply + "▌")
-                msg.markdown(reply)
+                reply = chatbot.stream_reply(
+                    key, "dashboard", CHATBOT_INSTRUCTION, prompt,
+                    context=box_context, context_key=box_context_key, placeholder=msg,
+                )
             except Exception as e:
                 reply = f"Maaf, error AI: {e}"
                 msg.markdown(reply)
@@ -332,4 +270,4 @@ if prompt:
             reply = "Fitur AI belum aktif. Tambahkan GEMINI_API_KEY di secrets/.env."
             msg.markdown(reply)
 
-    st.session_state.chat_history.append({"role":"assistant","content":reply})
\ No newline at end of file
+    st.session_state.chat_history.append({"role":"assistant","content":reply})
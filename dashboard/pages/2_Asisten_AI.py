@@ -1,6 +1,7 @@
 import streamlit as st
-import google.generativeai as genai
 import os
+import chatbot
+import db
 
 # --- Konfigurasi Chatbot ---
 st.set_page_config(page_title="Asisten KAMA", page_icon="🤖")
@@ -14,13 +15,21 @@ try:
     if not GEMINI_API_KEY:
         st.error("Kunci API Gemini tidak ditemukan. Mohon konfigurasikan di file `.env`.")
         st.stop()
-    genai.configure(api_key=GEMINI_API_KEY)
 except ImportError:
     st.error("Gagal mengimpor `python-dotenv`. Pastikan library sudah terinstal.")
     st.stop()
 
-# Inisialisasi model Generative AI
-model = genai.GenerativeModel('gemini-1.5-flash')
+# Konteks awal untuk AI (dipakai sebagai system instruction, dikirim sekali per sesi chat)
+ASSISTANT_INSTRUCTION = """
+Anda adalah Asisten AI untuk KAMA Smartbox.
+Tugas Anda adalah menjawab pertanyaan pengguna seputar:
+1. Cara penggunaan KAMA Smartbox.
+2. Tips menyimpan makanan (buah dan sayur).
+3. Tanda-tanda kelayakan makanan secara umum.
+4. Manfaat memantau suhu, kelembapan, dan gas.
+
+Jawab dengan ramah, informatif, dan dalam Bahasa Indonesia.
+"""
 
 # Inisialisasi riwayat chat di session state Streamlit
 if "chat_history" not in st.session_state:
@@ -41,28 +50,16 @@ if prompt := st.chat_input("Tanya seputar kelayakan makanan..."):
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
         full_response = ""
-        
-        # Konteks awal untuk AI
-        contextual_prompt = f"""
-        Anda adalah Asisten AI untuk KAMA Smartbox. 
-        Tugas Anda adalah menjawab pertanyaan pengguna seputar:
-        1. Cara penggunaan KAMA Smartbox.
-        2. Tips menyimpan makanan (buah dan sayur).
-        3. Tanda-tanda kelayakan makanan secara umum.
-        4. Manfaat memantau suhu, kelembapan, dan gas.
-        
-        Jawab dengan ramah, informatif, dan dalam Bahasa Indonesia.
-        
-        Pertanyaan pengguna: "{prompt}"
-        """
-        
+
         try:
-            # Menggunakan stream untuk respons yang lebih interaktif
-            responses = model.generate_content(contextual_prompt, stream=True)
-            for response in responses:
-                full_response += (response.text or "")
-                message_placeholder.markdown(full_response + "▌")
-            message_placeholder.markdown(full_response)
+            # Halaman ini bisa dibuka langsung, jadi bacaan box diambil sendiri.
+            latest = db.latest_reading()
+            full_response = chatbot.stream_reply(
+                GEMINI_API_KEY, "asisten", ASSISTANT_INSTRUCTION, prompt,
+                context=chatbot.box_context(latest),
+                context_key=chatbot.box_context_key(latest),
+                placeholder=message_placeholder,
+            )
         except Exception as e:
             full_response = f"Maaf, terjadi kesalahan saat menghubungi AI: {e}"
             message_placeholder.markdown(full_response)
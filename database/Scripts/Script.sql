@@ -40,3 +40,28 @@ ALTER TABLE kama_server   ADD COLUMN device_id VARCHAR(64);
 
 
 
+CREATE TABLE IF NOT EXISTS kama_device_state (
+    device_id VARCHAR(64) PRIMARY KEY,
+    state JSONB NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Acuan deadband ingest (pembacaan tersimpan terakhir), lihat INGEST_DEADBAND.
+ALTER TABLE kama_device_state ADD COLUMN IF NOT EXISTS deadband_ref JSONB;
+ALTER TABLE kama_device_state ADD COLUMN IF NOT EXISTS deadband_received BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE kama_device_state ADD COLUMN IF NOT EXISTS deadband_stored BIGINT NOT NULL DEFAULT 0;
+
+-- NOTIFY untuk ETL event-driven di server (LISTEN kama_realtime_insert).
+-- Level statement: satu notifikasi per INSERT, server men-debounce burst.
+CREATE OR REPLACE FUNCTION kama_realtime_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('kama_realtime_insert', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_kama_realtime_notify ON kama_realtime;
+CREATE TRIGGER trg_kama_realtime_notify
+AFTER INSERT ON kama_realtime
+FOR EACH STATEMENT EXECUTE FUNCTION kama_realtime_notify();
+
@@ -36,10 +36,26 @@ const float MQ135_RL = 10000.0;
 const float MQ135_CLEAN_AIR_FACTOR = 3.6;
 
 // Timing
+// Sensor selalu dibaca tiap READING_INTERVAL; "next_report_s" dari /ingest hanya
+// mengatur kapan laporan HTTP (/predict + /ingest) dikirim. Perubahan besar sejak
+// laporan terakhir memicu laporan lebih awal agar lonjakan tidak terlewat.
 unsigned long lastReading = 0;
 unsigned long lastDetailedLog = 0;
 const unsigned long READING_INTERVAL = 2000;
 const unsigned long LOG_INTERVAL = 10000;
+// Batas interval adaptif dari field "next_report_s" pada response /ingest
+const unsigned long MIN_REPORT_INTERVAL = 2000;
+const unsigned long MAX_REPORT_INTERVAL = 600000;
+unsigned long reportInterval = READING_INTERVAL;   // default sebelum ada saran dari server
+unsigned long lastReport = 0;
+bool hasReported = false;
+unsigned long backoffUntil = 0;   // dari Retry-After (429/503)
+// Ambang lapor-lebih-awal, dibandingkan dengan nilai pada laporan terakhir
+const float TEMP_REPORT_DELTA = 1.0;
+const int GAS_REPORT_DELTA = 150;
+float lastReportedTemp = NAN;
+int lastReportedGas = 0;
+String lastLocalStatus = "";
 
 // Sensor state
 float temperature = NAN;
@@ -55,6 +71,10 @@ void turnOffAllLEDs();
 void printHeader();
 void printDetailedLog();
 void setLEDByLabel(const String& label);
+String getCurrentStatus();
+bool shouldReport();
+void sendReport();
+void backOff(unsigned long retryMs);
 int readMQ135ADC();
 float adcToVoltage(int adc);
 float voltageToResistance(float vout);
@@ -131,73 +151,126 @@ void loop() {
     gasADC = adc;
     mqVoltage = adcToVoltage(adc);
     mqRS = voltageToResistance(mqVoltage);
+    lastReading = millis();
 
-    String pred_label = "unknown";
-
-    if (WiFi.status() == WL_CONNECTED) {
-      // Kirim data ke /predict (AI)
-      HTTPClient http;
-      http.begin(PREDICT_URL);
-      http.addHeader("Content-Type", "application/json");
-      StaticJsonDocument<256> doc;
-      doc["temperature"] = temperature;
-      doc["humidity"] = humidity;
-      doc["gas_level"] = gasADC;
-      doc["jenis_makanan"] = "fruits";
-      String payload;
-      serializeJson(doc, payload);
-      int httpCode = http.POST(payload);
-      if (httpCode == 200) {
-        String resp = http.getString();
-        StaticJsonDocument<128> respDoc;
-        DeserializationError err = deserializeJson(respDoc, resp);
-        if (!err && respDoc["label"]) {
-          pred_label = String(respDoc["label"].as<const char*>());
-          Serial.print("Predicted label from server: "); Serial.println(pred_label);
-        } else {
-          Serial.println("Server response parse error");
-        }
-      } else {
-        Serial.print("HTTP error: "); Serial.println(httpCode);
-      }
-      http.end();
-
-      // Kirim data ke /ingest (database)
-      HTTPClient http2;
-      http2.begin(INGEST_URL);
-      http2.addHeader("Content-Type", "application/json");
-      StaticJsonDocument<256> doc2;
-      doc2["battery"] = 100; //default
-      doc2["temperature"] = temperature;
-      doc2["humidity"] = humidity;
-      doc2["gas_level"] = gasADC;
-      doc2["status"] = pred_label;
-      String payload2;
-      serializeJson(doc2, payload2);
-      int httpCode2 = http2.POST(payload2);
-      if (httpCode2 == 201) {
-        Serial.println("Data berhasil dikirim ke database (kama_realtime)");
+    if (shouldReport()) sendReport();
+  }
+
+  if (millis() - lastDetailedLog >= LOG_INTERVAL) {
+    printDetailedLog(); lastDetailedLog = millis();
+  }
+}
+
+// Laporan jatuh tempo, atau bacaan lokal bergeser jauh sejak laporan terakhir.
+bool shouldReport() {
+  unsigned long now = millis();
+  if ((long)(backoffUntil - now) > 0) return false;
+  if (!hasReported || now - lastReport >= reportInterval) return true;
+  if (!isnan(temperature) && (isnan(lastReportedTemp) || fabs(temperature - lastReportedTemp) >= TEMP_REPORT_DELTA)) return true;
+  if (abs(gasADC - lastReportedGas) >= GAS_REPORT_DELTA) return true;
+  return getCurrentStatus() != lastLocalStatus;
+}
+
+// Server sedang membatasi: hormati header Retry-After sebagai jeda minimum.
+void backOff(unsigned long retryMs) {
+  backoffUntil = millis() + constrain(retryMs, MIN_REPORT_INTERVAL, MAX_REPORT_INTERVAL);
+}
+
+void sendReport() {
+  String pred_label = "unknown";
+  bool throttled = false;
+
+  if (WiFi.status() == WL_CONNECTED) {
+    // Kirim data ke /predict (AI)
+    HTTPClient http;
+    http.begin(PREDICT_URL);
+    http.addHeader("Content-Type", "application/json");
+    const char* predictHeaders[] = {"Retry-After"};
+    http.collectHeaders(predictHeaders, 1);
+    StaticJsonDocument<256> doc;
+    doc["temperature"] = temperature;
+    doc["humidity"] = humidity;
+    doc["gas_level"] = gasADC;
+    doc["jenis_makanan"] = "fruits";
+    doc["device_id"] = WiFi.macAddress();
+    String payload;
+    serializeJson(doc, payload);
+    int httpCode = http.POST(payload);
+    if (httpCode == 200) {
+      String resp = http.getString();
+      StaticJsonDocument<128> respDoc;
+      DeserializationError err = deserializeJson(respDoc, resp);
+      if (!err && respDoc["label"]) {
+        pred_label = String(respDoc["label"].as<const char*>());
+        Serial.print("Predicted label from server: "); Serial.println(pred_label);
       } else {
-        Serial.print("HTTP error (ingest): "); Serial.println(httpCode2);
+        Serial.println("Server response parse error");
       }
-      http2.end();
+    } else if (httpCode == 429 || httpCode == 503) {
+      // /predict dan /ingest berbagi bucket per device: pertahankan label lama,
+      // jangan kirim "unknown" ke /ingest, dan mundur sesuai Retry-After.
+      throttled = true;
+      pred_label = foodStatus;
+      backOff(http.header("Retry-After").toInt() * 1000UL);
+      Serial.print("Server sibuk (predict), HTTP "); Serial.println(httpCode);
     } else {
-      Serial.println("WiFi not connected, skipping prediction");
+      Serial.print("HTTP error: "); Serial.println(httpCode);
     }
-
-    Serial.print("Label diterima: [");
-    Serial.print(pred_label);
-    Serial.println("]");
-
-    setLEDByLabel(pred_label);
-    foodStatus = pred_label;
-    printDetailedLog();
-    lastReading = millis();
+    http.end();
   }
 
-  if (millis() - lastDetailedLog >= LOG_INTERVAL) {
-    printDetailedLog(); lastDetailedLog = millis();
+  if (WiFi.status() == WL_CONNECTED && !throttled) {
+    // Kirim data ke /ingest (database)
+    HTTPClient http2;
+    http2.begin(INGEST_URL);
+    http2.addHeader("Content-Type", "application/json");
+    const char* retryHeaders[] = {"Retry-After"};
+    http2.collectHeaders(retryHeaders, 1);
+    StaticJsonDocument<256> doc2;
+    doc2["battery"] = 100; //default
+    doc2["device_id"] = WiFi.macAddress(); // interval adaptif dihitung per device
+    doc2["temperature"] = temperature;
+    doc2["humidity"] = humidity;
+    doc2["gas_level"] = gasADC;
+    doc2["status"] = pred_label;
+    String payload2;
+    serializeJson(doc2, payload2);
+    int httpCode2 = http2.POST(payload2);
+    if (httpCode2 == 200 || httpCode2 == 201) {
+      Serial.println(httpCode2 == 201 ? "Data berhasil dikirim ke database (kama_realtime)" : "Data diterima server (tidak disimpan, deadband)");
+      // Server menentukan kapan laporan berikutnya perlu dikirim
+      String resp2 = http2.getString();
+      StaticJsonDocument<256> respDoc2;
+      if (!deserializeJson(respDoc2, resp2)) {
+        unsigned long nextMs = (respDoc2["next_report_s"] | 0UL) * 1000UL;
+        if (nextMs > 0) {
+          reportInterval = constrain(nextMs, MIN_REPORT_INTERVAL, MAX_REPORT_INTERVAL);
+          Serial.print("Interval laporan berikutnya (ms): "); Serial.println(reportInterval);
+        }
+      }
+    } else if (httpCode2 == 429 || httpCode2 == 503) {
+      backOff(http2.header("Retry-After").toInt() * 1000UL);
+      Serial.print("Server sibuk, HTTP "); Serial.println(httpCode2);
+    } else {
+      Serial.print("HTTP error (ingest): "); Serial.println(httpCode2);
+    }
+    http2.end();
+  } else if (!throttled) {
+    Serial.println("WiFi not connected, skipping prediction");
   }
+
+  Serial.print("Label diterima: [");
+  Serial.print(pred_label);
+  Serial.println("]");
+
+  setLEDByLabel(pred_label);
+  foodStatus = pred_label;
+  printDetailedLog();
+  lastReport = millis();
+  hasReported = true;
+  lastReportedTemp = temperature;
+  lastReportedGas = gasADC;
+  lastLocalStatus = getCurrentStatus();
 }
 
 void printHeader() {
@@ -1,15 +1,24 @@
-from flask import Flask, request, jsonify
-from apscheduler.schedulers.background import BackgroundScheduler
-import pandas as pd
+import time
+_STARTUP_T0 = time.perf_counter()
+
+# pandas, joblib, google.generativeai dan apscheduler sengaja diimpor di dalam
+# fungsi yang memakainya agar cold start (dan tiap worker gunicorn) tetap ringan.
+from flask import Flask, Response, request, jsonify
 import os
 import sys
-import joblib
-import numpy as np
-from threading import Lock
-import google.generativeai as genai
-from datetime import datetime
+from functools import wraps
+from threading import Lock, BoundedSemaphore, Thread
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-import traceback
+import atexit
+import json
+import math
+import logging
+import logging.handlers
+import queue
+import random
+
+import features as feature_engine
 
 try:
     import psycopg2
@@ -18,17 +27,141 @@ except ModuleNotFoundError:
     import psycopg as psycopg2
     from psycopg.extras import execute_values, execute_batch
 
+# --- Profil Waktu Startup ---
+_startup_phases = []
+_startup_last = _STARTUP_T0
+_startup_ready_ms = None
+_first_health_ms = None
+
+def _mark_startup(phase):
+    """Mencatat durasi fase startup sejak penanda sebelumnya."""
+    global _startup_last
+    now = time.perf_counter()
+    _startup_phases.append({'phase': phase, 'ms': round((now - _startup_last) * 1000, 1)})
+    _startup_last = now
+
+_mark_startup('imports')
+
 app = Flask(__name__)
 
 # --- Konfigurasi Kunci API dan Variabel Lingkungan ---
 load_dotenv()
 
+# --- Konfigurasi Logging ---
+# Semua log ditulis ke antrean (QueueHandler) lalu dikeluarkan oleh thread
+# QueueListener, sehingga thread request tidak pernah menunggu I/O stdout.
+# LOG_LEVEL        : level default, mis. INFO
+# LOG_LEVELS       : override per logger, mis. "kama.scheduler=DEBUG,kama.llm=WARNING"
+# LOG_SAMPLE_RATES : sampling log DEBUG per route, mis. "/ingest=0.01,/predict=0.05"
+
+def _parse_kv_env(name):
+    """Membaca variabel lingkungan berformat "k1=v1,k2=v2" menjadi dict."""
+    result = {}
+    for part in (os.getenv(name) or '').split(','):
+        if '=' in part:
+            k, v = part.split('=', 1)
+            if k.strip():
+                result[k.strip()] = v.strip()
+    return result
+
+class JsonFormatter(logging.Formatter):
+    """Format satu record log sebagai satu baris JSON."""
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        route = getattr(record, 'route', None)
+        if route:
+            entry['route'] = route
+        ctx = getattr(record, 'ctx', None)
+        if isinstance(ctx, dict):
+            entry.update(ctx)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RouteSampler(logging.Filter):
+    """Meloloskan hanya sebagian log DEBUG untuk route yang diberi sampling rate."""
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self.rates.get(getattr(record, 'route', None))
+        if rate is None:
+            return True
+        return random.random() < rate
+
+def _parse_sample_rates():
+    rates = {}
+    for route, value in _parse_kv_env('LOG_SAMPLE_RATES').items():
+        try:
+            rates[route] = min(max(float(value), 0.0), 1.0)
+        except ValueError:
+            pass
+    return rates
+
+_log_queue = queue.SimpleQueue()
+_log_listener = None
+
+def setup_logging():
+    """Memasang QueueHandler pada logger 'kama' dan menjalankan QueueListener."""
+    root = logging.getLogger('kama')
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    for name, level in _parse_kv_env('LOG_LEVELS').items():
+        logging.getLogger(name).setLevel(level.upper())
+    if not root.handlers:
+        # Record diformat di thread pemanggil; thread listener hanya menulis.
+        queue_handler = logging.handlers.QueueHandler(_log_queue)
+        queue_handler.setFormatter(JsonFormatter())
+        queue_handler.addFilter(RouteSampler(_parse_sample_rates()))
+        root.addHandler(queue_handler)
+        root.propagate = False
+    _start_log_listener()
+
+_log_listener_pid = None
+
+def _start_log_listener():
+    """Menjalankan QueueListener sekali per proses (thread tidak ikut ter-fork)."""
+    global _log_listener, _log_listener_pid
+    if _log_listener_pid == os.getpid():
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter('%(message)s'))
+    _log_listener = logging.handlers.QueueListener(_log_queue, stream_handler)
+    _log_listener.start()
+    _log_listener_pid = os.getpid()
+    atexit.register(_log_listener.stop)
+
+setup_logging()
+logger = logging.getLogger('kama.app')
+scheduler_logger = logging.getLogger('kama.scheduler')
+llm_logger = logging.getLogger('kama.llm')
+
+_mark_startup('logging')
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    print("Library Google Generative AI berhasil dikonfigurasi.")
-else:
-    print("PERINGATAN: GEMINI_API_KEY tidak ditemukan. Fitur rekomendasi LLM akan dinonaktifkan.")
+if not GEMINI_API_KEY:
+    logger.warning("GEMINI_API_KEY tidak ditemukan. Fitur rekomendasi LLM akan dinonaktifkan.")
+
+_genai = None
+_genai_lock = Lock()
+
+def get_genai():
+    """Mengimpor dan mengonfigurasi google.generativeai saat pertama kali dibutuhkan."""
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            _genai = genai
+            llm_logger.info("Library Google Generative AI berhasil dikonfigurasi.")
+        return _genai
 
 # --- Konfigurasi Koneksi Database ---
 DB_HOST = os.getenv("SERVER_DB_HOST") or os.getenv("REALTIME_DB_HOST")
@@ -43,8 +176,8 @@ except (ValueError, TypeError):
     DB_PORT = 5432
 
 _masked_pass = '***' if DB_PASS else ''
-print(f"PYTHON: {sys.executable}")
-print(f"DB CONN CONFIG: host={DB_HOST} port={DB_PORT} dbname={DB_NAME} user={DB_USER} password={_masked_pass}")
+logger.info("PYTHON: %s", sys.executable)
+logger.info("DB CONN CONFIG: host=%s port=%s dbname=%s user=%s password=%s", DB_HOST, DB_PORT, DB_NAME, DB_USER, _masked_pass)
 
 def get_conn():
     """Membuat koneksi ke database menggunakan variabel lingkungan yang dimuat."""
@@ -60,19 +193,157 @@ def get_conn():
         conn_kwargs = {k: v for k, v in conn_kwargs.items() if v is not None}
         return psycopg2.connect(**conn_kwargs)
     except Exception as e:
-        print(f"[get_conn] Koneksi gagal: {e}")
+        logger.error("[get_conn] Koneksi gagal: %s", e)
         raise
 
+# --- Rate Limiting & Load Shedding ---
+# Token bucket per device dan global, dicek di memori sebelum kerja DB/model.
+# Bucket per device hanya dipakai jika request menyertakan device_id: di balik
+# proxy/NAT seluruh armada berbagi satu IP, sehingga request tanpa device_id
+# hanya dibatasi bucket global.
+# Request yang melebihi batas mendapat 429 + Retry-After; jika slot koneksi DB
+# untuk /ingest sudah penuh, request ditolak lebih awal dengan 503.
+# Bucket ada di memori tiap worker; gunicorn.conf.py mengisi RATE_LIMIT_WORKERS
+# agar batas di bawah ini berlaku untuk seluruh server, bukan per worker.
+RATE_WORKERS = max(1, int(os.getenv('RATE_LIMIT_WORKERS', '1')))
+RATE_DEVICE_PER_S = float(os.getenv('RATE_LIMIT_DEVICE_PER_S', '0.5')) / RATE_WORKERS
+RATE_DEVICE_BURST = max(1.0, float(os.getenv('RATE_LIMIT_DEVICE_BURST', '5')) / RATE_WORKERS)
+RATE_GLOBAL_PER_S = float(os.getenv('RATE_LIMIT_GLOBAL_PER_S', '50')) / RATE_WORKERS
+RATE_GLOBAL_BURST = max(1.0, float(os.getenv('RATE_LIMIT_GLOBAL_BURST', '100')) / RATE_WORKERS)
+MAX_INFLIGHT_DB = int(os.getenv('MAX_INFLIGHT_DB', '10'))
+SHED_RETRY_AFTER_S = 5
+_BUCKET_IDLE_S = 600
+_MAX_BUCKETS = 10000
+
+_buckets = {}
+_rate_lock = Lock()
+_rate_stats = {'allowed': 0, 'limited_device': 0, 'limited_global': 0, 'shed': 0}
+_rate_device_stats = {}
+_db_slots = BoundedSemaphore(MAX_INFLIGHT_DB)
+_db_inflight = 0
+
+def _refill(key, rate, burst, now):
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = _buckets[key] = [burst, now]
+    bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+    bucket[1] = now
+    return bucket
+
+def _prune_buckets(now):
+    # Bucket yang lama tidak dipakai sudah penuh kembali; aman dihapus.
+    for key in [k for k, b in _buckets.items() if now - b[1] > _BUCKET_IDLE_S and k != '__global__']:
+        del _buckets[key]
+        _rate_device_stats.pop(key, None)
+
+def check_rate_limit(device_key=None):
+    """Mengambil satu token dari bucket device (jika `device_key` ada) dan global.
+
+    Mengembalikan (None, 0) jika diizinkan, atau (scope, retry_after_detik).
+    """
+    now = time.monotonic()
+    with _rate_lock:
+        if len(_buckets) > _MAX_BUCKETS:
+            _prune_buckets(now)
+        device = stats = None
+        if device_key is not None:
+            device = _refill(device_key, RATE_DEVICE_PER_S, RATE_DEVICE_BURST, now)
+            stats = _rate_device_stats.setdefault(device_key, {'allowed': 0, 'limited': 0})
+        glob = _refill('__global__', RATE_GLOBAL_PER_S, RATE_GLOBAL_BURST, now)
+        if device is not None and device[0] < 1:
+            _rate_stats['limited_device'] += 1
+            stats['limited'] += 1
+            return 'device', (1 - device[0]) / RATE_DEVICE_PER_S
+        if glob[0] < 1:
+            _rate_stats['limited_global'] += 1
+            if stats is not None:
+                stats['limited'] += 1
+            return 'global', (1 - glob[0]) / RATE_GLOBAL_PER_S
+        if device is not None:
+            device[0] -= 1
+            stats['allowed'] += 1
+        glob[0] -= 1
+        _rate_stats['allowed'] += 1
+        return None, 0
+
+def rate_limited(route):
+    """Decorator: menolak request dengan 429 sebelum handler menyentuh DB/model."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            data = request.get_json(force=True, silent=True)
+            device_id = data.get('device_id') if isinstance(data, dict) else None
+            device_key = str(device_id) if device_id else None
+            scope, retry_after = check_rate_limit(device_key)
+            if scope is not None:
+                retry_after = max(1, math.ceil(retry_after))
+                logger.debug('Rate limited', extra={'route': route, 'ctx': {'device': device_key, 'scope': scope}})
+                resp = jsonify({'error': 'rate limited', 'scope': scope, 'retry_after': retry_after})
+                return resp, 429, {'Retry-After': str(retry_after)}
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def shed_when_saturated(route):
+    """Decorator: 503 jika jumlah request yang sedang memakai koneksi DB sudah maksimum."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            global _db_inflight
+            if not _db_slots.acquire(blocking=False):
+                with _rate_lock:
+                    _rate_stats['shed'] += 1
+                logger.warning('Load shedding: slot DB penuh', extra={'route': route})
+                resp = jsonify({'error': 'server busy', 'retry_after': SHED_RETRY_AFTER_S})
+                return resp, 503, {'Retry-After': str(SHED_RETRY_AFTER_S)}
+            with _rate_lock:
+                _db_inflight += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with _rate_lock:
+                    _db_inflight -= 1
+                _db_slots.release()
+        return wrapper
+    return decorator
+
+@app.route('/limits', methods=['GET'])
+def limits():
+    """Counter limiter untuk tuning (per proses worker)."""
+    with _rate_lock:
+        top = sorted(_rate_device_stats.items(), key=lambda kv: kv[1]['limited'], reverse=True)[:20]
+        return jsonify({
+            'config': {
+                'device_per_s': RATE_DEVICE_PER_S, 'device_burst': RATE_DEVICE_BURST,
+                'global_per_s': RATE_GLOBAL_PER_S, 'global_burst': RATE_GLOBAL_BURST,
+                'max_inflight_db': MAX_INFLIGHT_DB,
+            },
+            'totals': dict(_rate_stats),
+            'db_inflight': _db_inflight,
+            'tracked_devices': len(_rate_device_stats),
+            'top_limited_devices': {k: v for k, v in top},
+        })
+
 # --- Fungsi Model Prediksi Status Makanan ---
 MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../ai/models/xgb_status_model.pkl'))
 _model = None
+_model_sig = None
 _model_lock = Lock()
 
+def _file_signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
 def get_model():
-    global _model
+    """Model status makanan; dimuat ulang bila file berubah (mis. setelah `ai/main.py --promote`)."""
+    global _model, _model_sig
     with _model_lock:
-        if _model is None:
-            print('Loading model from', MODEL_PATH)
+        sig = _file_signature(MODEL_PATH)
+        if _model is None or sig != _model_sig:
+            _model = None
+            _model_sig = sig
+            import joblib
+            logger.info('Loading model from %s', MODEL_PATH)
             loaded = joblib.load(MODEL_PATH)
             if isinstance(loaded, dict):
                 for key in ['models', 'model', 'estimator', 'clf']:
@@ -98,9 +369,10 @@ def get_model():
 
 # --- Endpoint untuk prediksi status makanan ---
 @app.route('/predict', methods=['POST'])
+@rate_limited('/predict')
 def predict():
     data = request.get_json(force=True)
-    if not data:
+    if not data or not isinstance(data, dict):
         return jsonify({'error': 'invalid json'}), 400
     try:
         temperature = float(data.get('temperature'))
@@ -110,6 +382,7 @@ def predict():
     except Exception as e:
         return jsonify({'error': f'missing or invalid input: {e}'}), 400
 
+    import pandas as pd
     X = pd.DataFrame([{
         'temperature': temperature,
         'humidity': humidity,
@@ -126,7 +399,10 @@ def predict():
     if label is None or label.isdigit():
         label_map = {0: "bad", 1: "good", 2: "warning"}
         label = label_map.get(int(pred_idx), str(pred_idx))
-    print(f"Predict: input={X.to_dict(orient='records')} label={label}")
+    logger.debug("Predict", extra={'route': '/predict', 'ctx': {
+        'temperature': temperature, 'humidity': humidity, 'gas_level': gas_level,
+        'jenis_makanan': jenis_makanan, 'label': label,
+    }})
     return jsonify({'label': label})
 
 # --- Fungsi Helper untuk LLM ---
@@ -139,41 +415,270 @@ def get_llm_recommendation(food_type: str, spoil_info: str) -> str:
             "Berikan 2-3 ide singkat dan praktis untuk mengolahnya agar tidak menjadi sampah, "
             "misalnya dijadikan kompos atau pupuk organik cair. Jawaban harus dalam format daftar bernomor."
         )
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        model = get_genai().GenerativeModel('gemini-1.5-flash')
         response = model.generate_content(prompt)
         return response.text.strip()
     except Exception as e:
-        print(f"[LLM Error] Gagal mendapatkan rekomendasi dari AI: {e}")
+        llm_logger.error("Gagal mendapatkan rekomendasi dari AI: %s", e)
         return "Gagal mendapatkan rekomendasi dari AI."
 
+# --- Fitur Temporal per Device ---
+# State rolling tiap device_id disimpan di tabel kama_device_state (JSONB) dan
+# baris itulah sumber kebenarannya: ingest mengunci baris dengan
+# SELECT ... FOR UPDATE di transaksi insert, sehingga semua worker gunicorn
+# memperbarui state yang sama secara berurutan, dan ETL membaca baris yang sama.
+DEFAULT_DEVICE_ID = 'default'
+TEMP_HIGH_THRESHOLD = float(os.getenv('TEMP_HIGH_THRESHOLD', feature_engine.TEMP_HIGH_THRESHOLD))
+GAS_HIGH_THRESHOLD = float(os.getenv('GAS_HIGH_THRESHOLD', feature_engine.GAS_HIGH_THRESHOLD))
+
+def _parse_device_state(value):
+    if not value:
+        return feature_engine.new_state()
+    return value if isinstance(value, dict) else json.loads(value)
+
+def lock_device_row(cur, device_id):
+    """Mengunci baris device untuk sisa transaksi (dibuat dulu jika belum ada).
+
+    Mengembalikan (state fitur, acuan deadband, now() transaksi DB).
+    """
+    cur.execute(
+        "INSERT INTO kama_device_state (device_id, state) VALUES (%s, %s) ON CONFLICT (device_id) DO NOTHING",
+        (device_id, json.dumps(feature_engine.new_state()))
+    )
+    cur.execute("SELECT state, deadband_ref, now() FROM kama_device_state WHERE device_id = %s FOR UPDATE", (device_id,))
+    state, ref, db_now = cur.fetchone()
+    if isinstance(ref, str):
+        ref = json.loads(ref)
+    return _parse_device_state(state), ref, db_now
+
+def update_device_features(cur, device_id, recorded_at, temperature, gas_level, lid_status=None, state=None):
+    """Memperbarui state fitur device dengan satu pembacaan di dalam transaksi `cur`.
+
+    `state` boleh diisi state yang sudah dikunci lewat `lock_device_row`. Commit
+    dilakukan oleh pemanggil; lock baris dilepas saat transaksi selesai.
+    """
+    if state is None:
+        state = lock_device_row(cur, device_id)[0]
+    feats = feature_engine.update_state(
+        state, recorded_at.timestamp(), temperature, gas_level, lid_status,
+        temp_threshold=TEMP_HIGH_THRESHOLD, gas_threshold=GAS_HIGH_THRESHOLD,
+    )
+    cur.execute(
+        "UPDATE kama_device_state SET state = %s, updated_at = now() WHERE device_id = %s",
+        (json.dumps(state), device_id)
+    )
+    return feats
+
+def get_device_features(cur, device_id):
+    """Fitur temporal terkini untuk device, dibaca dari kama_device_state."""
+    cur.execute("SELECT state FROM kama_device_state WHERE device_id = %s", (device_id or DEFAULT_DEVICE_ID,))
+    row = cur.fetchone()
+    return feature_engine.compute_features(_parse_device_state(row[0] if row else None))
+
+# --- Kompresi Deadband pada Ingest (opsional) ---
+# Pembacaan hanya disimpan jika salah satu nilai bergeser melebihi toleransi
+# dari nilai terakhir yang disimpan, status berubah, atau sudah lewat
+# DEADBAND_HEARTBEAT_S sejak penyimpanan terakhir. Acuan (baris tersimpan
+# terakhir) ada di kama_device_state.deadband_ref dan dicek di bawah lock baris
+# device, sehingga semua worker memakai acuan yang sama; waktunya selalu jam DB.
+# Penghitung diterima/disimpan untuk /compression ada di baris yang sama.
+# Pembaca merekonstruksi deret dengan sample-and-hold: nilai pada waktu t =
+# baris tersimpan terakhir <= t, dengan galat maksimum sebesar toleransi; jeda >
+# heartbeat berarti device offline. Grafik dashboard memakai garis bertangga
+# (line_shape='hv') untuk hal ini; pembaca lain harus melakukan hal yang sama.
+INGEST_DEADBAND = os.getenv('INGEST_DEADBAND', '0') == '1'
+DEADBAND_DEVICES = {d.strip() for d in os.getenv('DEADBAND_DEVICES', '').split(',') if d.strip()}
+DEADBAND_TOLERANCES = {
+    'temperature': float(os.getenv('DEADBAND_TEMPERATURE', '0.3')),
+    'humidity': float(os.getenv('DEADBAND_HUMIDITY', '1.0')),
+    'gas_level': float(os.getenv('DEADBAND_GAS', '10')),
+}
+DEADBAND_HEARTBEAT_S = float(os.getenv('DEADBAND_HEARTBEAT_S', '300'))
+
+def deadband_enabled(device_key):
+    return INGEST_DEADBAND and (not DEADBAND_DEVICES or device_key in DEADBAND_DEVICES)
+
+def deadband_check(last, reading, now):
+    """Mengembalikan alasan penyimpanan (str) atau None jika pembacaan boleh dilewati.
+
+    `last` adalah acuan dari `lock_device_row`, `now` epoch detik jam DB.
+    """
+    if last is None:
+        return 'first'
+    if reading.get('status') != last['reading'].get('status'):
+        return 'status'
+    if now - last['ts'] >= DEADBAND_HEARTBEAT_S:
+        return 'heartbeat'
+    for field, tolerance in DEADBAND_TOLERANCES.items():
+        value, ref = reading.get(field), last['reading'].get(field)
+        try:
+            if abs(float(value) - float(ref)) > tolerance:
+                return field
+        except (TypeError, ValueError):
+            return field
+    return None
+
+def deadband_commit(cur, device_key, reading, recorded_at):
+    """Mencatat pembacaan yang disimpan sebagai acuan berikutnya (dalam transaksi insert)."""
+    cur.execute(
+        "UPDATE kama_device_state SET deadband_ref = %s, deadband_stored = deadband_stored + 1 WHERE device_id = %s",
+        (json.dumps({'ts': recorded_at.timestamp(), 'reading': reading}), device_key)
+    )
+
+@app.route('/compression', methods=['GET'])
+def compression():
+    """Rasio kompresi deadband per device (pembacaan diterima / disimpan), dari kama_device_state."""
+    try:
+        conn = get_conn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT device_id, deadband_received, deadband_stored FROM kama_device_state "
+                    "WHERE deadband_received > 0 ORDER BY device_id"
+                )
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error("Error fetching deadband stats: %s", e)
+        return jsonify({'error': str(e)}), 500
+    devices = {
+        device_id: {'received': received, 'stored': stored,
+                    'ratio': round(received / stored, 2) if stored else None}
+        for device_id, received, stored in rows
+    }
+    received = sum(v['received'] for v in devices.values())
+    stored = sum(v['stored'] for v in devices.values())
+    return jsonify({
+        'enabled': INGEST_DEADBAND,
+        'tolerances': DEADBAND_TOLERANCES,
+        'heartbeat_s': DEADBAND_HEARTBEAT_S,
+        'received': received,
+        'stored': stored,
+        'ratio': round(received / stored, 2) if stored else None,
+        'devices': devices,
+    })
+
+# --- Interval Pelaporan Adaptif ---
+# Response /ingest menyertakan `next_report_s`: makanan segar dengan gas stabil
+# cukup dilaporkan jarang, sedangkan status 'bad'/'warning' atau gas yang naik
+# cepat dilaporkan lebih sering. Baterai rendah memperpanjang interval kecuali
+# status 'bad'. Firmware (iot/kama.ino) memakai nilai ini sebagai jeda berikutnya.
+REPORT_INTERVAL_BY_STATUS = {
+    'good': float(os.getenv('REPORT_INTERVAL_GOOD_S', '60')),
+    'warning': float(os.getenv('REPORT_INTERVAL_WARNING_S', '20')),
+    'bad': float(os.getenv('REPORT_INTERVAL_BAD_S', '10')),
+}
+REPORT_INTERVAL_DEFAULT_S = float(os.getenv('REPORT_INTERVAL_DEFAULT_S', '10'))
+REPORT_INTERVAL_MIN_S = float(os.getenv('REPORT_INTERVAL_MIN_S', '5'))
+REPORT_INTERVAL_MAX_S = float(os.getenv('REPORT_INTERVAL_MAX_S', '300'))
+# Slope gas (unit/menit) yang membuat interval menjadi setengahnya.
+REPORT_GAS_SLOPE_REF = float(os.getenv('REPORT_GAS_SLOPE_REF', '5'))
+REPORT_LOW_BATTERY = float(os.getenv('REPORT_LOW_BATTERY', '30'))
+
+def compute_next_report_s(status, battery=None, feats=None):
+    """Interval laporan berikutnya (detik) dari status, laju perubahan gas, dan baterai."""
+    interval = REPORT_INTERVAL_BY_STATUS.get(str(status).lower(), REPORT_INTERVAL_DEFAULT_S)
+    if feats:
+        slope = feats.get('gas_slope_5m') or 0.0
+        if math.isfinite(slope):
+            interval /= 1.0 + abs(slope) / REPORT_GAS_SLOPE_REF
+    try:
+        battery = float(battery)
+    except (TypeError, ValueError):
+        battery = None
+    if battery is not None and battery < REPORT_LOW_BATTERY and str(status).lower() != 'bad':
+        interval *= 1.0 + (REPORT_LOW_BATTERY - max(battery, 0.0)) / REPORT_LOW_BATTERY
+    if INGEST_DEADBAND and DEADBAND_HEARTBEAT_S > 0:
+        # Jeda lebih lama dari heartbeat akan terbaca sebagai device offline.
+        interval = min(interval, DEADBAND_HEARTBEAT_S)
+    return int(round(min(max(interval, REPORT_INTERVAL_MIN_S), REPORT_INTERVAL_MAX_S)))
+
 # --- Endpoint untuk ESP32: Ingest Data ---
+def _ingest_features(cur, device_key, recorded_at, temperature, gas_level, lid_status, state=None, deadband_reading=None):
+    """Update fitur (dan acuan deadband) di bawah savepoint.
+
+    Kegagalan update fitur tidak boleh menggagalkan penyimpanan data sensor.
+    """
+    cur.execute("SAVEPOINT device_features")
+    try:
+        feats = update_device_features(cur, device_key, recorded_at, temperature, gas_level, lid_status, state=state)
+        if deadband_reading is not None:
+            deadband_commit(cur, device_key, deadband_reading, recorded_at)
+        return feats
+    except Exception as e:
+        cur.execute("ROLLBACK TO SAVEPOINT device_features")
+        logger.warning('Gagal memperbarui fitur device %s: %s', device_key, e, extra={'route': '/ingest'})
+        return None
+
 @app.route('/ingest', methods=['POST'])
+@rate_limited('/ingest')
+@shed_when_saturated('/ingest')
 def ingest():
     data = request.get_json(force=True)
-    if not data:
+    if not data or not isinstance(data, dict):
         return jsonify({'error': 'invalid json'}), 400
     battery = data.get('battery')
     temperature = data.get('temperature')
     humidity = data.get('humidity')
     gas_level = data.get('gas_level')
     status = data.get('status')
+    device_id = data.get('device_id')
+    lid_status = data.get('lid_status')
+    device_key = device_id or DEFAULT_DEVICE_ID
+    reading = {'temperature': temperature, 'humidity': humidity, 'gas_level': gas_level, 'status': status}
+    deadband = deadband_enabled(device_key)
+    state = None
+    conn = None
     try:
-        print('Ingest from', request.remote_addr, 'payload=', data)
+        logger.debug('Ingest', extra={'route': '/ingest', 'ctx': {'remote_addr': request.remote_addr, 'payload': data}})
         conn = get_conn()
         cur = conn.cursor()
+        if deadband:
+            # Kegagalan membaca acuan deadband berarti pembacaan tetap disimpan.
+            cur.execute("SAVEPOINT deadband")
+            reason = 'error'
+            try:
+                state, last, db_now = lock_device_row(cur, device_key)
+                reason = deadband_check(last, reading, db_now.timestamp())
+                cur.execute(
+                    "UPDATE kama_device_state SET deadband_received = deadband_received + 1 WHERE device_id = %s",
+                    (device_key,)
+                )
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT deadband")
+                logger.warning('Gagal membaca acuan deadband device %s: %s', device_id, e, extra={'route': '/ingest'})
+                state, deadband = None, False
+            if reason is None:
+                # Jam DB yang sama dengan recorded_at pada pembacaan yang disimpan.
+                feats = _ingest_features(cur, device_key, db_now, temperature, gas_level, lid_status, state)
+                conn.commit()
+                cur.close()
+                logger.debug('Deadband: pembacaan tidak disimpan', extra={'route': '/ingest', 'ctx': {'device': device_key}})
+                return jsonify({'ok': True, 'stored': False, 'next_report_s': compute_next_report_s(status, battery, feats)}), 200
         cur.execute(
-            "INSERT INTO kama_realtime (battery, temperature, humidity, gas_level, status) VALUES (%s, %s, %s, %s, %s) RETURNING id, recorded_at",
-            (battery, temperature, humidity, gas_level, status)
+            "INSERT INTO kama_realtime (battery, temperature, humidity, gas_level, status, device_id) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id, recorded_at",
+            (battery, temperature, humidity, gas_level, status, device_id)
         )
         row = cur.fetchone()
+        feats = _ingest_features(cur, device_key, row[1], temperature, gas_level, lid_status, state,
+                                 deadband_reading=reading if deadband else None)
         conn.commit()
         cur.close()
-        conn.close()
-        print('Inserted id=', row[0])
-        return jsonify({'ok': True, 'id': row[0], 'recorded_at': row[1].isoformat()}), 201
+        logger.debug('Inserted', extra={'route': '/ingest', 'ctx': {'id': row[0]}})
+        return jsonify({
+            'ok': True,
+            'stored': True,
+            'id': row[0],
+            'recorded_at': row[1].isoformat(),
+            'next_report_s': compute_next_report_s(status, battery, feats),
+        }), 201
     except Exception as e:
-        print('Ingest error:', e)
+        logger.exception('Ingest error: %s', e, extra={'route': '/ingest'})
         return jsonify({'error': str(e)}), 500
+    finally:
+        if conn is not None:
+            conn.close()
 
 @app.route('/')
 def index():
@@ -181,8 +686,21 @@ def index():
 
 @app.route('/health')
 def health():
+    global _first_health_ms
+    if _first_health_ms is None:
+        _first_health_ms = round((time.perf_counter() - _STARTUP_T0) * 1000, 1)
     return jsonify({'status': 'ok'})
 
+@app.route('/startup_report', methods=['GET'])
+def startup_report():
+    """Durasi tiap fase startup dan waktu sampai /health pertama kali dijawab."""
+    return jsonify({
+        'pid': os.getpid(),
+        'phases': _startup_phases,
+        'ready_ms': _startup_ready_ms,
+        'first_health_ms': _first_health_ms,
+    })
+
 @app.route('/latest_status', methods=['GET'])
 def latest_status():
     try:
@@ -201,19 +719,30 @@ def latest_status():
 # --- Logic untuk Scheduled Job ---
 SPOIL_MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../ai/models/xgb_predicted_spoiled.pkl'))
 _spoil_model = None
+_spoil_model_sig = None
 _spoil_model_lock = Lock()
 
 def get_spoil_model():
-    global _spoil_model
+    """Model regresi waktu busuk.
+
+    Jika model dilatih dengan fitur temporal (lihat `features.TEMPORAL_FEATURES`),
+    kolom tersebut otomatis disertakan oleh `build_spoil_features`. File model
+    dimuat ulang bila berubah di disk (mis. setelah `ai/main.py --promote`).
+    """
+    global _spoil_model, _spoil_model_sig
     with _spoil_model_lock:
-        if _spoil_model is None:
-            print(f"[Scheduler] Memuat model dari {SPOIL_MODEL_PATH}...")
+        sig = _file_signature(SPOIL_MODEL_PATH)
+        if _spoil_model is None or sig != _spoil_model_sig:
+            _spoil_model = None
+            _spoil_model_sig = sig
+            scheduler_logger.info("Memuat model dari %s...", SPOIL_MODEL_PATH)
+            import joblib
             loaded_obj = joblib.load(SPOIL_MODEL_PATH)
             if isinstance(loaded_obj, dict):
                 for key in ['model', 'estimator', 'predictor', 'xgb']:
                     if key in loaded_obj and hasattr(loaded_obj[key], 'predict'):
                         _spoil_model = loaded_obj[key]
-                        print(f"[Scheduler] Model ditemukan dalam kunci: '{key}'")
+                        scheduler_logger.info("Model ditemukan dalam kunci: '%s'", key)
                         break
                 else:
                     raise ValueError(f"Tidak dapat menemukan objek model yang valid di dalam dictionary. Kunci: {list(loaded_obj.keys())}")
@@ -221,13 +750,128 @@ def get_spoil_model():
                 _spoil_model = loaded_obj
         return _spoil_model
 
+SPOIL_BASE_FEATURES = ['temperature', 'humidity', 'gas_level', 'jenis_makanan']
+
+def build_spoil_features(model, df, cur=None):
+    """Menyusun matriks fitur sesuai kolom yang diharapkan model spoil.
+
+    Model lama hanya memakai `SPOIL_BASE_FEATURES`; model yang mengenal kolom
+    temporal (via `feature_names_in_`) mendapat fitur dari state per device.
+    """
+    import pandas as pd
+    expected = getattr(model, 'feature_names_in_', None)
+    expected = SPOIL_BASE_FEATURES if expected is None else list(expected)
+    missing = [c for c in expected if c not in df.columns]
+    if missing and cur is not None:
+        if 'device_id' in df.columns:
+            device_ids = df['device_id']
+        else:
+            device_ids = [DEFAULT_DEVICE_ID] * len(df)
+        by_device = {device_id: get_device_features(cur, device_id) for device_id in set(device_ids)}
+        rows = [by_device[device_id] for device_id in device_ids]
+        temporal = pd.DataFrame(rows, index=df.index)
+        df = df.join(temporal[[c for c in missing if c in temporal.columns]])
+    return df[expected]
+
+# --- Surrogate Model Spoil (opsional) ---
+# SPOIL_SURROGATE=1 mengganti tree walk dengan interpolasi trilinear pada grid
+# yang dihitung sekali per file model dan di-cache di ai/models/.cache/.
+SPOIL_SURROGATE = os.getenv('SPOIL_SURROGATE', '0') == '1'
+SPOIL_SURROGATE_FOODS = [f.strip() for f in os.getenv('SPOIL_SURROGATE_FOODS', 'fruits').split(',') if f.strip()]
+SURROGATE_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../ai/models/.cache'))
+_spoil_surrogate = None
+_spoil_surrogate_sig = None
+_spoil_surrogate_lock = Lock()
+
+def _surrogate_axes_from_env():
+    """SPOIL_SURROGATE_AXES, mis. "temperature=0:40:81,gas_level=300:600:301"."""
+    axes = {}
+    for name, spec in _parse_kv_env('SPOIL_SURROGATE_AXES').items():
+        lo, hi, n = spec.split(':')
+        axes[name] = (float(lo), float(hi), int(n))
+    return axes
+
+def get_spoil_surrogate():
+    """Grid surrogate untuk model spoil saat ini, atau None jika tidak aktif/tidak cocok."""
+    global _spoil_surrogate, _spoil_surrogate_sig
+    if not SPOIL_SURROGATE:
+        return None
+    model = get_spoil_model()
+    with _spoil_surrogate_lock:
+        if _spoil_surrogate_sig == _spoil_model_sig:
+            return _spoil_surrogate
+        _spoil_surrogate_sig = _spoil_model_sig
+        _spoil_surrogate = None
+        expected = getattr(model, 'feature_names_in_', None)
+        if expected is not None and list(expected) != SPOIL_BASE_FEATURES:
+            scheduler_logger.warning("Surrogate spoil dinonaktifkan: model memakai fitur %s", list(expected))
+            return None
+
+        import hashlib
+        import pandas as pd
+        import surrogate
+        with open(SPOIL_MODEL_PATH, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        axes = _surrogate_axes_from_env()
+        key = hashlib.sha256(json.dumps([digest, SPOIL_SURROGATE_FOODS, sorted(axes.items())]).encode()).hexdigest()[:12]
+        cache_path = os.path.join(SURROGATE_CACHE_DIR, f'spoil_surrogate.{key}.npz')
+        if os.path.exists(cache_path):
+            _spoil_surrogate = surrogate.load_grid(cache_path)
+        else:
+            def predict_fn(food, t, h, g):
+                X = pd.DataFrame({'temperature': t, 'humidity': h, 'gas_level': g, 'jenis_makanan': food})
+                return model.predict(X[SPOIL_BASE_FEATURES])
+
+            started = time.perf_counter()
+            _spoil_surrogate = surrogate.build_grid(predict_fn, SPOIL_SURROGATE_FOODS, axes)
+            os.makedirs(SURROGATE_CACHE_DIR, exist_ok=True)
+            surrogate.save_grid(cache_path, _spoil_surrogate, model_digest=digest)
+            scheduler_logger.info("Grid surrogate spoil dibangun dalam %.1fs", time.perf_counter() - started)
+        scheduler_logger.info("Surrogate spoil aktif", extra={'ctx': {
+            'max_abs_error': _spoil_surrogate['max_abs_error'],
+            'mean_abs_error': _spoil_surrogate['mean_abs_error'],
+            'grid_shape': list(_spoil_surrogate['values'].shape),
+        }})
+        return _spoil_surrogate
+
+def predict_spoil(model, X):
+    """Prediksi waktu busuk; memakai surrogate jika aktif dan jenis makanan dikenal."""
+    grid = get_spoil_surrogate()
+    if grid is not None and set(X['jenis_makanan']).issubset(grid['food_types']):
+        import surrogate
+        return surrogate.interpolate(grid, list(X['jenis_makanan']), X['temperature'], X['humidity'], X['gas_level'])
+    return model.predict(X)
+
+@app.route('/spoil_surrogate', methods=['GET'])
+def spoil_surrogate_report():
+    grid = get_spoil_surrogate()
+    if grid is None:
+        return jsonify({'enabled': False})
+    return jsonify({
+        'enabled': True,
+        'food_types': grid['food_types'],
+        'grid_shape': list(grid['values'].shape[1:]),
+        'axes': {name: [float(ax[0]), float(ax[-1]), len(ax)] for name, ax in zip(['temperature', 'humidity', 'gas_level'], grid['axes'])},
+        'max_abs_error': grid['max_abs_error'],
+        'mean_abs_error': grid['mean_abs_error'],
+    })
+
+# Kunci advisory Postgres agar hanya satu proses/worker yang menjalankan ETL.
+ETL_ADVISORY_LOCK_KEY = 4242001
+
 def run_spoil_prediction_job():
-    print("--- [Scheduler] Memulai Proses ETL & Prediksi ---")
+    import pandas as pd
+    scheduler_logger.info("Memulai Proses ETL & Prediksi")
     realtime_conn = None
     server_conn = None
     try:
-        realtime_conn = get_conn()
         server_conn = get_conn()
+        with server_conn.cursor() as lock_cur:
+            lock_cur.execute("SELECT pg_try_advisory_lock(%s)", (ETL_ADVISORY_LOCK_KEY,))
+            if not lock_cur.fetchone()[0]:
+                scheduler_logger.info("ETL sedang berjalan di proses lain, dilewati.")
+                return
+        realtime_conn = get_conn()
 
         with server_conn.cursor() as server_cur:
             server_cur.execute("SELECT MAX(recorded_at) FROM kama_server")
@@ -236,21 +880,21 @@ def run_spoil_prediction_job():
         with realtime_conn.cursor() as realtime_cur:
             if last_timestamp:
                 realtime_cur.execute(
-                    "SELECT id, battery, temperature, humidity, gas_level, status, recorded_at FROM kama_realtime WHERE recorded_at > %s",
+                    "SELECT id, battery, temperature, humidity, gas_level, status, recorded_at, device_id FROM kama_realtime WHERE recorded_at > %s",
                     (last_timestamp,)
                 )
             else:
                 realtime_cur.execute(
-                    "SELECT id, battery, temperature, humidity, gas_level, status, recorded_at FROM kama_realtime"
+                    "SELECT id, battery, temperature, humidity, gas_level, status, recorded_at, device_id FROM kama_realtime"
                 )
             new_data = realtime_cur.fetchall()
 
         if not new_data:
-            print("[Scheduler] Tidak ada data baru untuk ditransfer.")
+            scheduler_logger.info("Tidak ada data baru untuk ditransfer.")
             return
 
-        print(f"[Scheduler] Ditemukan {len(new_data)} baris data baru untuk ditransfer.")
-        insert_query = "INSERT INTO kama_server (id, battery, temperature, humidity, gas_level, status, recorded_at) VALUES %s ON CONFLICT (id) DO NOTHING RETURNING id;"
+        scheduler_logger.info("Ditemukan %d baris data baru untuk ditransfer.", len(new_data))
+        insert_query = "INSERT INTO kama_server (id, battery, temperature, humidity, gas_level, status, recorded_at, device_id) VALUES %s ON CONFLICT (id) DO NOTHING RETURNING id;"
         
         with server_conn.cursor() as server_cur_insert:
             inserted_ids_tuples = execute_values(server_cur_insert, insert_query, new_data, fetch=True)
@@ -258,60 +902,59 @@ def run_spoil_prediction_job():
             new_ids = [item[0] for item in inserted_ids_tuples]
         
         if not new_ids:
-            print("[Scheduler] Tidak ada baris baru yang berhasil dimasukkan (kemungkinan data duplikat).")
+            scheduler_logger.info("Tidak ada baris baru yang berhasil dimasukkan (kemungkinan data duplikat).")
             return
             
-        print("[Scheduler] Mengambil baris data terbaru untuk diproses.")
+        scheduler_logger.debug("Mengambil baris data terbaru untuk diproses.")
         # Hanya ambil satu baris terakhir yang baru saja dimasukkan
         with server_conn.cursor() as server_cur_select:
             server_cur_select.execute(
-                "SELECT id, temperature, humidity, gas_level, status, jenis_makanan FROM kama_server WHERE id = ANY(%s) ORDER BY recorded_at DESC LIMIT 1",
+                "SELECT id, temperature, humidity, gas_level, status, jenis_makanan, device_id FROM kama_server WHERE id = ANY(%s) ORDER BY recorded_at DESC LIMIT 1",
                 (new_ids,) 
             )
             rows_to_process = server_cur_select.fetchall()
 
-        print(f"[Scheduler] Jumlah baris yang akan diproses untuk prediksi/LLM: {len(rows_to_process)}")
+        scheduler_logger.debug("Jumlah baris yang akan diproses untuk prediksi/LLM: %d", len(rows_to_process))
         spoil_model = get_spoil_model()
 
-        df_to_predict = pd.DataFrame(rows_to_process, columns=['id', 'temperature', 'humidity', 'gas_level', 'status', 'jenis_makanan'])
-        features = ['temperature', 'humidity', 'gas_level', 'jenis_makanan']
-        X_predict = df_to_predict[features]
+        df_to_predict = pd.DataFrame(rows_to_process, columns=['id', 'temperature', 'humidity', 'gas_level', 'status', 'jenis_makanan', 'device_id'])
+        with server_conn.cursor() as server_cur_features:
+            X_predict = build_spoil_features(spoil_model, df_to_predict, server_cur_features)
 
-        print(f"[Scheduler] Melakukan prediksi 'predicted_spoil' untuk {len(X_predict)} baris.")
-        predictions = spoil_model.predict(X_predict)
+        scheduler_logger.debug("Melakukan prediksi 'predicted_spoil' untuk %d baris.", len(X_predict))
+        predictions = predict_spoil(spoil_model, X_predict)
         df_to_predict['predicted_spoil'] = predictions
 
-        print("[Scheduler] Memproses hasil dan menyiapkan update database...")
+        scheduler_logger.debug("Memproses hasil dan menyiapkan update database...")
         update_query = "UPDATE kama_server SET predicted_spoil = %s, recommendation_text = %s WHERE id = %s"
         update_data = []
 
         for index, row in df_to_predict.iterrows():
             recommendation = None
             if row['status'] == 'bad':
-                print(f"[Scheduler] Status 'bad' terdeteksi untuk id: {row['id']}. Memanggil LLM...")
+                scheduler_logger.info("Status 'bad' terdeteksi untuk id: %s. Memanggil LLM...", row['id'])
                 spoil_info = f"Prediksi waktu busuk adalah {row['predicted_spoil']:.2f} hari."
                 food_type = row['jenis_makanan'] or 'buah-buahan' # Menggunakan 'or' untuk mengatasi None/kosong
                 recommendation = get_llm_recommendation(food_type, spoil_info)
-                print(f"[Scheduler] Rekomendasi diterima untuk id: {row['id']}.")
+                scheduler_logger.info("Rekomendasi diterima untuk id: %s.", row['id'])
             update_data.append((row['predicted_spoil'], recommendation, row['id']))
 
         if update_data:
-            print(f"[Scheduler] Melakukan batch update untuk {len(update_data)} baris.")
+            scheduler_logger.debug("Melakukan batch update untuk %d baris.", len(update_data))
             with server_conn.cursor() as server_cur_update:
                 execute_batch(server_cur_update, update_query, update_data)
                 server_conn.commit()
-            print("[Scheduler] Batch update berhasil.")
-        print("[Scheduler] Semua proses untuk data baru telah selesai.")
+            scheduler_logger.debug("Batch update berhasil.")
+        scheduler_logger.info("Semua proses untuk data baru telah selesai.")
 
     except Exception as e:
-        print(f"[Scheduler] Terjadi error pada job: {e}")
-        traceback.print_exc()
+        scheduler_logger.exception("Terjadi error pada job: %s", e)
     finally:
         if realtime_conn:
             realtime_conn.close()
         if server_conn:
             server_conn.close()
-        print("--- [Scheduler] Proses Selesai (koneksi ditutup) ---")
+        scheduler_logger.info("Proses Selesai (koneksi ditutup)")
 
 @app.route('/latest_spoil_prediction', methods=['GET'])
 def latest_spoil_prediction():
@@ -344,25 +987,323 @@ def latest_spoil_prediction():
                 'message': 'No prediction data found.'
             }), 404
     except Exception as e:
-        print(f"Error fetching latest spoil prediction: {e}")
+        logger.error("Error fetching latest spoil prediction: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+# --- Export Data Historis ---
+# Streaming kama_server dengan server-side cursor: baris diambil per
+# EXPORT_CHUNK_ROWS dan langsung dikirim sebagai response chunked, sehingga
+# memori tetap konstan berapa pun rentang waktunya. Nama kolom mengikuti
+# ai/dataset/dataset_kama.csv agar hasilnya bisa langsung dipakai ai/main.py.
+#
+# Export berjalan di satu thread worker gthread (lihat gunicorn.conf.py): worker
+# tetap mengirim heartbeat selama streaming, sehingga GUNICORN_TIMEOUT tidak
+# memotong download panjang. Agar export tidak memakan thread /ingest, tiap
+# worker hanya menjalankan EXPORT_MAX_CONCURRENT export sekaligus (sisanya 503),
+# dan satu response dibatasi EXPORT_MAX_ROWS baris; ambil rentang berikutnya
+# dengan `start` = recorded_at baris terakhir (header X-Export-Row-Limit;
+# baris di batas itu terulang, dedupe berdasarkan id).
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '5000'))
+EXPORT_MAX_ROWS = int(os.getenv('EXPORT_MAX_ROWS', '1000000'))
+EXPORT_MAX_CONCURRENT = int(os.getenv('EXPORT_MAX_CONCURRENT', '1'))
+_export_slots = BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('recorded_at', 'recorded_at'),
+    ('device_id', 'device_id'),
+    ('jenis_makanan', 'jenis_makanan'),
+    ('battery', 'battery'),
+    ('temperature', 'temperature'),
+    ('humidity', 'humidity'),
+    ('gas_level', 'gas_level'),
+    ('status', 'status'),
+    ('predicted_spoil', 'predicted_spoiled'),
+]
+
+def _export_query(device_id, start, end):
+    where = []
+    params = []
+    if device_id:
+        where.append("device_id = %s")
+        params.append(device_id)
+    if start:
+        where.append("recorded_at >= %s")
+        params.append(start)
+    if end:
+        where.append("recorded_at < %s")
+        params.append(end)
+    select = ", ".join(f"{src} AS {dst}" if src != dst else src for src, dst in EXPORT_COLUMNS)
+    query = f"SELECT {select} FROM kama_server"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    return query + " ORDER BY recorded_at, id LIMIT %s", params + [EXPORT_MAX_ROWS]
+
+def _iter_export_rows(conn, query, params):
+    """Menghasilkan batch baris dari server-side cursor."""
+    with conn.cursor(name='kama_export') as cur:
+        cur.itersize = EXPORT_CHUNK_ROWS
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            yield rows
+
+def _format_dataset_ts(value):
+    # Format sama dengan dataset_kama.csv, mis. "2025-09-02 01:20:42.005 +0700".
+    if not isinstance(value, datetime):
+        return value
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] + value.strftime(' %z')
+
+def _stream_csv(batches):
+    import csv
+    import io
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([dst for _, dst in EXPORT_COLUMNS])
+    for rows in batches:
+        for row in rows:
+            writer.writerow((row[0], _format_dataset_ts(row[1])) + tuple(row[2:]))
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+class _ChunkSink:
+    """File-like minimal untuk ParquetWriter; byte yang ditulis diambil per row group."""
+    def __init__(self):
+        self.chunks = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def _stream_parquet(batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('recorded_at', pa.timestamp('us', tz='UTC')),
+        ('device_id', pa.string()),
+        ('jenis_makanan', pa.string()),
+        ('battery', pa.int32()),
+        ('temperature', pa.float32()),
+        ('humidity', pa.float32()),
+        ('gas_level', pa.float32()),
+        ('status', pa.string()),
+        ('predicted_spoiled', pa.float32()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+@app.route('/export', methods=['GET'])
+def export():
+    """Export kama_server. Query: device_id, start, end (ISO 8601), format=csv|parquet."""
+    fmt = request.args.get('format', 'csv').lower()
+    device_id = request.args.get('device_id')
+    try:
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError as e:
+        return jsonify({'error': f'invalid start/end: {e}'}), 400
+    if fmt == 'csv':
+        streamer, mimetype = _stream_csv, 'text/csv'
+    elif fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return jsonify({'error': 'parquet export requires pyarrow'}), 501
+        streamer, mimetype = _stream_parquet, 'application/vnd.apache.parquet'
+    else:
+        return jsonify({'error': "format must be 'csv' or 'parquet'"}), 400
+
+    query, params = _export_query(device_id, start, end)
+    if not _export_slots.acquire(blocking=False):
+        resp = jsonify({'error': 'export already running', 'retry_after': SHED_RETRY_AFTER_S})
+        return resp, 503, {'Retry-After': str(SHED_RETRY_AFTER_S)}
+    try:
+        conn = get_conn()
+    except Exception as e:
+        _export_slots.release()
         return jsonify({'error': str(e)}), 500
+    logger.info('Export dimulai', extra={'route': '/export', 'ctx': {'format': fmt, 'device_id': device_id, 'start': start, 'end': end}})
+    filename = f"kama_server_{device_id or 'all'}.{fmt}"
+    response = Response(
+        streamer(_iter_export_rows(conn, query, params)),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Export-Row-Limit': str(EXPORT_MAX_ROWS),
+        },
+    )
+    # Dipanggil saat streaming selesai maupun saat klien memutus koneksi.
+    response.call_on_close(conn.close)
+    response.call_on_close(_export_slots.release)
+    return response
+
+# --- Pemicu ETL (interval, manual, dan LISTEN/NOTIFY) ---
+# Insert ke kama_realtime memicu NOTIFY (lihat trigger di database/Scripts/Script.sql).
+# Listener men-debounce notifikasi beruntun menjadi satu run ETL; timer interval
+# tetap berjalan sebagai jaring pengaman bila notifikasi terlewat.
+ETL_LISTEN = os.getenv('ETL_LISTEN', '1') == '1'
+ETL_NOTIFY_CHANNEL = 'kama_realtime_insert'
+ETL_DEBOUNCE_S = float(os.getenv('ETL_DEBOUNCE_S', '3'))
+ETL_MAX_DELAY_S = float(os.getenv('ETL_MAX_DELAY_S', '30'))
+ETL_INTERVAL_MIN = float(os.getenv('ETL_INTERVAL_MIN', '5'))
+_etl_state_lock = Lock()
+_etl_running = False
+_etl_rerun = False
+
+def trigger_etl(reason):
+    """Menjalankan ETL; jika sedang berjalan, cukup tandai agar diulang sekali setelahnya."""
+    global _etl_running, _etl_rerun
+    with _etl_state_lock:
+        if _etl_running:
+            _etl_rerun = True
+            return False
+        _etl_running = True
+    scheduler_logger.debug("ETL dipicu", extra={'ctx': {'reason': reason}})
+    try:
+        while True:
+            run_spoil_prediction_job()
+            with _etl_state_lock:
+                if not _etl_rerun:
+                    break
+                _etl_rerun = False
+    finally:
+        with _etl_state_lock:
+            _etl_running = False
+            _etl_rerun = False
+    return True
+
+def _etl_listener_loop():
+    import select
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = get_conn()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {ETL_NOTIFY_CHANNEL}")
+            scheduler_logger.info("Listener ETL aktif pada channel '%s'", ETL_NOTIFY_CHANNEL)
+            backoff = 1
+            first_at = last_at = None
+            while True:
+                now = time.monotonic()
+                if last_at is None:
+                    timeout = 60
+                else:
+                    timeout = max(0.0, min(last_at + ETL_DEBOUNCE_S, first_at + ETL_MAX_DELAY_S) - now)
+                if select.select([conn], [], [], timeout)[0]:
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        last_at = time.monotonic()
+                        first_at = first_at or last_at
+                elif last_at is None:
+                    # Idle: pastikan koneksi masih hidup.
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                now = time.monotonic()
+                if last_at is not None and (now - last_at >= ETL_DEBOUNCE_S or now - first_at >= ETL_MAX_DELAY_S):
+                    first_at = last_at = None
+                    trigger_etl('notify')
+        except Exception as e:
+            scheduler_logger.warning("Listener ETL terputus: %s; mencoba lagi dalam %ds", e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        finally:
+            if conn is not None:
+                conn.close()
 
 @app.route('/force_run_job', methods=['GET'])
 def force_run_job():
-    print("\n!!! Memicu job secara manual via endpoint /force_run_job !!!\n")
-    run_spoil_prediction_job()
+    logger.warning("Memicu job secara manual via endpoint /force_run_job")
+    if not trigger_etl('manual'):
+        return jsonify({'status': 'ok', 'message': 'Job sedang berjalan; akan diulang setelah selesai.'})
     return jsonify({'status': 'ok', 'message': 'Job prediksi kebusukan telah dipicu. Periksa log di terminal.'})
 
-scheduler = BackgroundScheduler(daemon=True)
-scheduler.add_job(
-    run_spoil_prediction_job,
-    'interval',
-    minutes=5,
-    next_run_time=datetime.now()
-)
-scheduler.start()
-print("Scheduler internal telah dimulai.")
-print("Job pertama akan langsung dijalankan, lalu berulang setiap 5 menit.")
+_mark_startup('config')
+
+def preload():
+    """Memuat library berat dan model sekali di master gunicorn (preload_app).
+
+    Worker hasil fork berbagi halaman memori ini secara copy-on-write, sehingga
+    tidak perlu mengimpor pandas/joblib atau membaca file model lagi.
+    """
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    _mark_startup('preload_libs')
+    get_model()
+    get_spoil_model()
+    _mark_startup('preload_models')
+    logger.info("Preload selesai", extra={'ctx': {'phases': _startup_phases}})
+
+scheduler = None
+_background_pid = None
+
+def start_background():
+    """Menjalankan thread latar (listener log, scheduler, listener ETL) di proses saat ini.
+
+    Aman dipanggil berulang kali; thread tidak ikut ter-fork sehingga pada
+    gunicorn dengan preload_app fungsi ini dipanggil lagi dari hook post_fork.
+    """
+    global scheduler, _background_pid
+    if _background_pid == os.getpid():
+        return
+    _background_pid = os.getpid()
+    _start_log_listener()
+    from apscheduler.schedulers.background import BackgroundScheduler
+    scheduler = BackgroundScheduler(daemon=True)
+    scheduler.add_job(
+        trigger_etl,
+        'interval',
+        args=['interval'],
+        minutes=ETL_INTERVAL_MIN,
+        next_run_time=datetime.now()
+    )
+    scheduler.start()
+    scheduler_logger.info("Scheduler internal telah dimulai.")
+    scheduler_logger.info("Job pertama akan langsung dijalankan, lalu berulang setiap %s menit.", ETL_INTERVAL_MIN)
+    if ETL_LISTEN:
+        Thread(target=_etl_listener_loop, name='etl-listener', daemon=True).start()
+    _mark_startup('background')
+
+# gunicorn.conf.py menunda thread latar sampai setelah fork.
+if os.getenv('KAMA_DEFER_BACKGROUND') != '1':
+    start_background()
+
+_startup_ready_ms = round((time.perf_counter() - _STARTUP_T0) * 1000, 1)
+logger.info("Startup selesai", extra={'ctx': {'ready_ms': _startup_ready_ms, 'phases': _startup_phases}})
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
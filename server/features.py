@@ -0,0 +1,130 @@
+"""Fitur temporal per device untuk model prediksi kebusukan.
+
+State tiap device disimpan sebagai dict biasa (bisa langsung di-serialize ke
+JSON) dan diperbarui dengan biaya O(1) per pembacaan sensor:
+
+- EWMA gas_level,
+- slope gas_level (per menit) dengan regresi linear berbobot eksponensial
+  untuk beberapa jendela waktu,
+- akumulasi detik di atas ambang suhu / gas,
+- detik sejak tutup box terakhir kali dibuka.
+
+Modul ini sengaja tidak bergantung pada Flask agar bisa dipakai ulang oleh
+pipeline training (`ai/main.py`) saat me-replay data historis.
+"""
+import math
+
+# Konstanta default, bisa dioverride lewat argumen `update_state`.
+EWMA_TAU_S = 300.0
+SLOPE_WINDOWS_S = {'5m': 300.0, '30m': 1800.0}
+TEMP_HIGH_THRESHOLD = 8.0
+GAS_HIGH_THRESHOLD = 2000.0
+# Jeda lebih panjang dari ini dianggap device mati; tidak ikut diakumulasi.
+MAX_GAP_S = 900.0
+
+TEMPORAL_FEATURES = [
+    'gas_ewma',
+    'gas_slope_5m',
+    'gas_slope_30m',
+    'temp_above_s',
+    'gas_above_s',
+    'since_lid_open_s',
+]
+
+
+def new_state():
+    """State kosong untuk device yang belum pernah terlihat."""
+    return {
+        'last_ts': None,
+        'last_temperature': None,
+        'last_gas': None,
+        'gas_ewma': None,
+        'slope': {name: [0.0, 0.0, 0.0, 0.0, 0.0] for name in SLOPE_WINDOWS_S},
+        'temp_above_s': 0.0,
+        'gas_above_s': 0.0,
+        'last_lid_open_ts': None,
+    }
+
+
+def _update_slope(sums, dt, gas, window_s):
+    """Memperbarui jumlah berbobot [S0, St, Sg, Stt, Stg] untuk regresi gas ~ t.
+
+    Waktu diukur relatif terhadap pembacaan terakhir (t=0), sehingga saat
+    titik baru masuk, semua titik lama digeser sejauh -dt lalu diberi decay.
+    """
+    s0, st, sg, stt, stg = sums
+    if dt > 0:
+        stt = stt - 2.0 * dt * st + dt * dt * s0
+        st = st - dt * s0
+        stg = stg - dt * sg
+        decay = math.exp(-dt / window_s)
+        s0, st, sg, stt, stg = (s0 * decay, st * decay, sg * decay, stt * decay, stg * decay)
+    return [s0 + 1.0, st, sg + gas, stt, stg]
+
+
+def _slope_per_minute(sums):
+    s0, st, sg, stt, stg = sums
+    denom = s0 * stt - st * st
+    if s0 < 2.0 or abs(denom) < 1e-9:
+        return 0.0
+    return (s0 * stg - st * sg) / denom * 60.0
+
+
+def update_state(state, ts, temperature, gas_level, lid_status=None,
+                 temp_threshold=TEMP_HIGH_THRESHOLD, gas_threshold=GAS_HIGH_THRESHOLD):
+    """Memasukkan satu pembacaan ke `state` (dimodifikasi in-place) dan mengembalikan fitur.
+
+    `ts` adalah epoch detik. Pembacaan yang lebih tua dari pembacaan terakhir
+    diabaikan agar state tidak mundur.
+    """
+    last_ts = state.get('last_ts')
+    if last_ts is not None and ts < last_ts:
+        return compute_features(state, last_ts)
+    dt = 0.0 if last_ts is None else ts - last_ts
+    counted_dt = min(dt, MAX_GAP_S)
+
+    # Waktu di atas ambang dihitung dari kondisi pembacaan sebelumnya.
+    last_temp = state.get('last_temperature')
+    last_gas = state.get('last_gas')
+    if last_temp is not None and last_temp > temp_threshold:
+        state['temp_above_s'] += counted_dt
+    if last_gas is not None and last_gas > gas_threshold:
+        state['gas_above_s'] += counted_dt
+
+    if gas_level is not None:
+        gas_level = float(gas_level)
+        if state.get('gas_ewma') is None:
+            state['gas_ewma'] = gas_level
+        else:
+            alpha = 1.0 - math.exp(-dt / EWMA_TAU_S) if dt > 0 else 0.0
+            state['gas_ewma'] += alpha * (gas_level - state['gas_ewma'])
+        slopes = state.setdefault('slope', {})
+        for name, window_s in SLOPE_WINDOWS_S.items():
+            sums = slopes.get(name) or [0.0, 0.0, 0.0, 0.0, 0.0]
+            if dt > MAX_GAP_S:
+                sums = [0.0, 0.0, 0.0, 0.0, 0.0]
+            slopes[name] = _update_slope(sums, dt, gas_level, window_s)
+
+    if lid_status and str(lid_status).upper() == 'OPEN':
+        state['last_lid_open_ts'] = ts
+
+    state['last_ts'] = ts
+    state['last_temperature'] = None if temperature is None else float(temperature)
+    state['last_gas'] = gas_level
+    return compute_features(state, ts)
+
+
+def compute_features(state, now_ts=None):
+    """Mengubah state menjadi dict fitur sesuai `TEMPORAL_FEATURES`."""
+    if now_ts is None:
+        now_ts = state.get('last_ts')
+    slopes = state.get('slope') or {}
+    lid_ts = state.get('last_lid_open_ts')
+    return {
+        'gas_ewma': float('nan') if state.get('gas_ewma') is None else state['gas_ewma'],
+        'gas_slope_5m': _slope_per_minute(slopes.get('5m', [0.0] * 5)),
+        'gas_slope_30m': _slope_per_minute(slopes.get('30m', [0.0] * 5)),
+        'temp_above_s': state.get('temp_above_s', 0.0),
+        'gas_above_s': state.get('gas_above_s', 0.0),
+        'since_lid_open_s': float('nan') if lid_ts is None or now_ts is None else max(now_ts - lid_ts, 0.0),
+    }
@@ -0,0 +1,40 @@
+# Konfigurasi gunicorn untuk server KAMA.
+# Jalankan dari folder server: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+# Pada worker gthread, timeout hanya berlaku untuk heartbeat worker, bukan
+# lama satu request, sehingga streaming GET /export yang panjang tidak diputus.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+
+# Worker ber-thread: tiap worker melayani beberapa request sekaligus, sehingga
+# batas MAX_INFLIGHT_DB di app.py benar-benar bisa penuh dan /ingest mendapat
+# 503 saat database lambat, sementara thread sisanya tetap melayani route lain.
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+os.environ.setdefault('MAX_INFLIGHT_DB', str(max(1, threads * 3 // 4)))
+
+# Token bucket di app.py disimpan per proses; batasnya dibagi rata ke semua
+# worker agar total armada tetap sesuai RATE_LIMIT_* (perkiraan, karena
+# request satu device tidak selalu jatuh ke worker yang sama).
+os.environ.setdefault('RATE_LIMIT_WORKERS', str(workers))
+
+# Dengan preload_app, app.py (beserta pandas/joblib dan model bila
+# PRELOAD_MODELS=1) dimuat sekali di master lalu dibagi ke worker via fork.
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+# Thread latar (scheduler, listener log) tidak bertahan setelah fork, jadi
+# app.py tidak menjalankannya saat diimpor; post_fork yang memulainya.
+os.environ.setdefault('KAMA_DEFER_BACKGROUND', '1')
+
+
+def when_ready(server):
+    if preload_app and os.getenv('PRELOAD_MODELS', '1') == '1':
+        import app
+        app.preload()
+
+
+def post_fork(server, worker):
+    import app
+    app.start_background()